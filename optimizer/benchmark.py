@@ -0,0 +1,227 @@
+"""
+Benchmark of schedulers on generated problem families.
+
+Every scheduler solves every problem after `warmup` untimed runs, `repetitions` timed runs
+and one run under tracemalloc for the peak size of the Python heap, which leaves out memory of
+solver subprocesses, e.g. CBC of LinearProgrammingScheduler. Plan quality is the gap between the plan's
+score and the best score known for the problem, from this run or the baseline. Results are
+written as JSON, and compared with a baseline when one is given:
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json  # exits with 1 on regressions
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from itertools import product
+from typing import List, Dict, Callable
+
+import numpy as np
+
+from volttron_optimizer import IScheduler, NoDelayScheduler, BruteForceScheduler, LinearProgrammingScheduler, \
+    GreedyScheduler, AdaptiveScheduler, Request, profile_columns, scatter_profiles, score_plans
+import utils
+
+
+@dataclass(frozen=True)
+class ProblemSpec:
+    requests: int
+    profile_length: int
+    lookahead: int
+    timeout_spread: int  # timeouts are drawn from 0..timeout_spread
+    supply: str  # see SUPPLY_SHAPES
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        return f'{self.supply}-r{self.requests}-p{self.profile_length}-l{self.lookahead}-t{self.timeout_spread}-s{self.seed}'
+
+
+SUPPLY_SHAPES: Dict[str, Callable[[np.array], np.array]] = {
+    'flat': lambda hours: np.full(len(hours), 0.5),
+    'sine': lambda hours: np.clip(np.sin((2*np.pi/24)*(hours-6)), 0, 1),
+    'evening': lambda hours: np.clip(np.sin((2*np.pi/24)*(hours-6)), 0, 1)[::-1],  # falling supply
+    'none': lambda hours: np.zeros(len(hours)),
+}
+
+
+def generate_problem(spec: ProblemSpec):
+    """Returns available energy and requests of a problem, the same for the same spec."""
+    rng = np.random.default_rng(spec.seed)
+    hours = 6 + np.arange(spec.lookahead) / 4  # ticks of 15 minutes from 6:00
+    available_energy = SUPPLY_SHAPES[spec.supply](hours)
+    requests = [
+        Request(i, f'device{i}', rng.uniform(0.05, 0.4, spec.profile_length), int(rng.integers(0, spec.timeout_spread + 1)))
+        for i in range(spec.requests)
+    ]
+    return available_energy, requests
+
+
+def problem_family(requests=(2, 4, 6), profile_lengths=(4,), lookaheads=(24,), timeout_spreads=(8,),
+                   supplies=('sine',), seeds=(0,)) -> List[ProblemSpec]:
+    """Returns specs of all combinations of the parameters, e.g. problems growing in one of them."""
+    return [ProblemSpec(*values) for values in product(requests, profile_lengths, lookaheads, timeout_spreads, supplies, seeds)]
+
+
+# scaling curves along every parameter, the others fixed
+DEFAULT_FAMILIES = {
+    'requests': problem_family(requests=(1, 2, 4, 6, 8, 12)),
+    'profile_length': problem_family(requests=(4,), profile_lengths=(2, 4, 8, 12)),
+    'lookahead': problem_family(requests=(4,), lookaheads=(12, 24, 48)),
+    'timeout_spread': problem_family(requests=(4,), timeout_spreads=(0, 4, 8, 16)),
+    'supply': problem_family(requests=(4,), supplies=tuple(SUPPLY_SHAPES)),
+}
+
+SCHEDULERS: Dict[str, Callable[[int], IScheduler]] = {
+    'NoDelayScheduler': lambda lookahead: NoDelayScheduler(),
+    'BruteForceScheduler': BruteForceScheduler,
+    'LinearProgrammingScheduler': LinearProgrammingScheduler,
+    'GreedyScheduler': GreedyScheduler,
+    'AdaptiveScheduler': lambda lookahead: AdaptiveScheduler(
+        lookahead, [BruteForceScheduler(lookahead), LinearProgrammingScheduler(lookahead), GreedyScheduler(lookahead)], slo=0.5),
+}
+
+# brute force is skipped above this many candidate plans
+MAX_CANDIDATES = 2_000_000
+
+
+def plan_score(available_energy: np.array, requests: List[Request], plan: Dict[int, int], lookahead: int) -> float:
+    offsets = np.array([[plan[request.request_id] for request in requests]], dtype=int)
+    values, lengths = profile_columns(requests)
+    planned_energy = scatter_profiles(values, lengths, offsets, lookahead)
+    return float(score_plans(utils.pad(available_energy, lookahead), planned_energy, offsets)[0])
+
+
+def candidates(spec: ProblemSpec, requests: List[Request]) -> int:
+    return int(np.prod([min(request.timeout, spec.lookahead - len(request.profile)) + 1 for request in requests], dtype=float))
+
+
+def measure(scheduler: IScheduler, spec: ProblemSpec, warmup: int, repetitions: int) -> dict:
+    if repetitions < 1:
+        raise ValueError("At least one timed repetition is needed, got {}".format(repetitions))
+    available_energy, requests = generate_problem(spec)
+    for _ in range(warmup):
+        scheduler.schedule(available_energy, requests)
+
+    times = []
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        plan = scheduler.schedule(available_energy, requests)
+        times.append(time.perf_counter() - started)
+
+    # traced separately, as tracing slows down allocations
+    tracemalloc.start()
+    scheduler.schedule(available_energy, requests)
+    peak_python_heap = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'time_median': float(np.median(times)),
+        'time_min': float(np.min(times)),
+        'peak_python_heap': peak_python_heap,
+        'score': plan_score(available_energy, requests, plan, spec.lookahead),
+    }
+
+
+def run(families: Dict[str, List[ProblemSpec]], schedulers: List[str], warmup: int = 1, repetitions: int = 5,
+        best_known: Dict[str, float] = None) -> dict:
+    best_known = dict(best_known or {})
+    results = []
+    measured = {}  # families share some problems, those are measured once
+    for family, specs in families.items():
+        for spec in specs:
+            _, requests = generate_problem(spec)
+            for scheduler_name in schedulers:
+                entry = {'family': family, 'problem': spec.name, **asdict(spec), 'scheduler': scheduler_name}
+                if scheduler_name == 'BruteForceScheduler' and candidates(spec, requests) > MAX_CANDIDATES:
+                    results.append({**entry, 'skipped': True})
+                    continue
+                if (spec, scheduler_name) not in measured:
+                    measured[spec, scheduler_name] = measure(SCHEDULERS[scheduler_name](spec.lookahead), spec, warmup, repetitions)
+                entry.update(measured[spec, scheduler_name])
+                best_known[spec.name] = min(best_known.get(spec.name, np.inf), entry['score'])
+                results.append(entry)
+
+    for entry in results:
+        if not entry.get('skipped'):
+            entry['gap'] = entry['score'] - best_known[entry['problem']]
+    return {
+        'meta': {'time': time.time(), 'python': platform.python_version(), 'numpy': np.__version__,
+                 'machine': platform.machine(), 'warmup': warmup, 'repetitions': repetitions},
+        'best_known': best_known,
+        'results': results,
+    }
+
+
+def regressions(report: dict, baseline: dict, time_tolerance: float = 0.5, time_slack: float = 0.005,
+                memory_tolerance: float = 0.5, score_tolerance: float = 1e-6) -> List[str]:
+    """Returns a description of every result worse than the same result of the baseline:
+    slower by more than `time_tolerance` (relative) and `time_slack` seconds, using more Python heap
+    by more than `memory_tolerance`, or with a plan scoring worse by `score_tolerance`.
+    Scores are compared rather than gaps, which grow whenever a better plan becomes known."""
+    previous = {(entry['problem'], entry['scheduler']): entry for entry in baseline['results'] if not entry.get('skipped')}
+    found = []
+    for entry in report['results']:
+        key = (entry['problem'], entry['scheduler'])
+        if entry.get('skipped') or key not in previous:
+            continue
+        old = previous[key]
+        name = '{} on {}'.format(entry['scheduler'], entry['problem'])
+        if entry['time_median'] > old['time_median'] * (1 + time_tolerance) + time_slack:
+            found.append('{}: time {:.4f}s, baseline {:.4f}s'.format(name, entry['time_median'], old['time_median']))
+        if entry['peak_python_heap'] > old['peak_python_heap'] * (1 + memory_tolerance):
+            found.append('{}: peak Python heap {} B, baseline {} B'.format(name, entry['peak_python_heap'], old['peak_python_heap']))
+        if entry['score'] > old['score'] + score_tolerance:
+            found.append('{}: score {:.4f}, baseline {:.4f}'.format(name, entry['score'], old['score']))
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks schedulers on generated problem families.")
+    parser.add_argument('--schedulers', nargs='+', default=list(SCHEDULERS), choices=list(SCHEDULERS))
+    parser.add_argument('--families', nargs='+', default=list(DEFAULT_FAMILIES), choices=list(DEFAULT_FAMILIES))
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--output', help="file to write the results to")
+    parser.add_argument('--baseline', help="results to compare with, regressions make the benchmark fail")
+    parser.add_argument('--time-tolerance', type=float, default=0.5)
+    parser.add_argument('--memory-tolerance', type=float, default=0.5)
+    args = parser.parse_args(argv)
+    if args.repetitions < 1:
+        parser.error("--repetitions must be at least 1")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    families = {family: DEFAULT_FAMILIES[family] for family in args.families}
+    report = run(families, args.schedulers, args.warmup, args.repetitions,
+                 best_known=baseline['best_known'] if baseline else None)
+
+    for entry in report['results']:
+        if entry.get('skipped'):
+            print(f"{entry['scheduler']:28} {entry['problem']:32} skipped")
+        else:
+            print(f"{entry['scheduler']:28} {entry['problem']:32} {entry['time_median']:9.4f}s "
+                  f"{entry['peak_python_heap'] / 1024:9.1f} KiB  gap {entry['gap']:.4f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline:
+        found = regressions(report, baseline, args.time_tolerance, memory_tolerance=args.memory_tolerance)
+        for regression in found:
+            print('REGRESSION', regression)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
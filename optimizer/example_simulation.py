@@ -0,0 +1,24 @@
+from volttron_optimizer import *
+from simulation import simulate, sweep, synthetic_scenario
+
+if __name__ == '__main__':
+    scenario = synthetic_scenario(days=7, requests_per_day=12, seed=0)
+
+    lookahead = 6*4  # 6 hours
+    schedulers = {
+        'NoDelayScheduler': NoDelayScheduler(),
+        'BruteForceScheduler': BruteForceScheduler(lookahead),
+        'LinearProgrammingScheduler': LinearProgrammingScheduler(lookahead),
+    }
+
+    for scheduler_name, result in sweep(scenario, schedulers).items():
+        print(scheduler_name, result.cost, result.delays.mean(), result.solve_time.sum())
+
+    result = simulate(scenario, schedulers['NoDelayScheduler'])
+    fig, ax = plt.subplots()
+    ax.set_xlabel('ticks')
+    ax.set_ylabel('energy')
+    ax.plot(result.supplied_energy, color='green', label='supplied')
+    ax.plot(result.consumed_energy, color='black', label='consumed')
+    ax.legend(loc='upper right')
+    fig.savefig('img/example_simulation.svg')
@@ -0,0 +1,131 @@
+import heapq
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from volttron_optimizer import IScheduler, Hub, Request, score_plans
+
+
+@dataclass
+class Scenario:
+    """Inputs of a simulated run on a virtual clock of `ticks` ticks.
+
+    Sources are given as energy over the whole run. Every `source_period` ticks the Hub gets
+    the next `horizon` ticks of each of them, like a forecast published by a panel.
+    Requests arrive at given ticks.
+    """
+    ticks: int
+    sources: Dict[str, np.array]
+    arrivals: List[Tuple[int, Request]]
+    horizon: int = 6*4
+    source_period: int = 4
+
+
+@dataclass
+class SimulationResult:
+    """Timelines of a run, one sample per tick."""
+    supplied_energy: np.array  # produced by sources
+    consumed_energy: np.array  # by jobs running in the tick
+    score: np.array  # of the Hub's plan after the tick's events
+    waiting: np.array  # requests
+    running: np.array  # jobs
+    solve_time: np.array  # seconds spent scheduling, 0 when the tick did not schedule
+    delays: np.array = field(default_factory=lambda: np.array([], dtype=int))  # ticks from arrival to start per request
+
+    @property
+    def cost(self) -> float:
+        """Score of what actually happened, comparable between schedulers."""
+        delays = self.delays if len(self.delays) else np.zeros(1, dtype=int)
+        return float(score_plans(self.supplied_energy, self.consumed_energy, delays))
+
+
+# events at the same tick are handled in this order, the tick itself comes last
+SOURCE, REQUEST, TICK = 0, 1, 2
+
+
+def simulate(scenario: Scenario, scheduler: IScheduler) -> SimulationResult:
+    """Runs a Hub through a scenario as fast as possible. Requests of the scenario are not modified."""
+    hub = Hub(scheduler)
+    ticks = scenario.ticks
+
+    events = []
+    for tick in range(0, ticks, scenario.source_period):
+        for source_name in scenario.sources:
+            events.append((tick, SOURCE, len(events), source_name))
+    for tick, request in scenario.arrivals:
+        if tick < ticks:
+            events.append((tick, REQUEST, len(events), replace(request)))  # timeouts are counted down
+    for tick in range(ticks):
+        events.append((tick, TICK, len(events), None))
+    heapq.heapify(events)
+
+    supplied_energy, consumed_energy, score = np.zeros(ticks), np.zeros(ticks), np.zeros(ticks)
+    waiting, running = np.zeros(ticks, dtype=int), np.zeros(ticks, dtype=int)
+    solve_time = np.zeros(ticks)
+    arrived: Dict[int, int] = {}
+    delays: List[int] = []
+    dirty = False
+
+    while events:
+        tick, kind, _, payload = heapq.heappop(events)
+        if kind == SOURCE:
+            profile = scenario.sources[payload][tick:tick+scenario.horizon]
+            hub.update_source_profile(payload, profile, autoschedule=False)
+            dirty = True
+        elif kind == REQUEST:
+            arrived[payload.request_id] = tick
+            hub.add_request(payload, autoschedule=False)
+            dirty = True
+        else:
+            if dirty and hub.waiting_requests:
+                started = time.perf_counter()
+                hub.schedule()
+                solve_time[tick] = time.perf_counter() - started
+            dirty = False
+
+            available, assigned, _ = hub.current_tick_summary()
+            supplied_energy[tick] = available + assigned
+            score[tick] = hub.score if hub.waiting_requests else 0.0
+            waiting[tick] = len(hub.waiting_requests)
+            running[tick] = len(hub.running_jobs)
+
+            # the same requests Hub.tick is about to start
+            starting = [request for request in hub.waiting_requests
+                        if hub.plan[request.request_id] == 0 or request.timeout == 0]
+            consumed_energy[tick] = assigned + sum(request.profile[0] for request in starting if len(request.profile))
+            delays.extend(tick - arrived.pop(request.request_id) for request in starting)
+            hub.tick()
+
+    return SimulationResult(supplied_energy, consumed_energy, score, waiting, running, solve_time,
+                            np.array(delays, dtype=int))
+
+
+def sweep(scenario: Scenario, schedulers: Dict[str, IScheduler], max_workers: int = None) -> Dict[str, SimulationResult]:
+    """Simulates the same scenario with every scheduler, each one in a worker process."""
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = {name: executor.submit(simulate, scenario, scheduler) for name, scheduler in schedulers.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def synthetic_scenario(days: int, requests_per_day: float, ticks_per_day: int = 24*4, seed: int = None,
+                       max_timeout: int = 6*4) -> Scenario:
+    """Returns a scenario of a single panel with noisy daily production and requests arriving
+    at random between 7:00 and 22:00, with random profiles of 2 to 12 ticks."""
+    rng = np.random.default_rng(seed)
+    ticks = days * ticks_per_day
+
+    hours = np.arange(ticks) * 24 / ticks_per_day
+    noise = rng.uniform(low=-0.1, high=0, size=ticks)
+    solar_profile = np.clip(np.sin((2*np.pi/24)*(hours-6)) + noise, 0, 1)
+
+    count = rng.poisson(requests_per_day * days)
+    arrival_ticks = np.sort(rng.integers(0, days, count) * ticks_per_day
+                            + rng.integers(7 * ticks_per_day // 24, 22 * ticks_per_day // 24, count))
+    arrivals = [
+        (int(tick), Request(i, f'device{i}', rng.uniform(0.05, 0.4, rng.integers(2, 13)), int(rng.integers(0, max_timeout + 1))))
+        for i, tick in enumerate(arrival_ticks)
+    ]
+    return Scenario(ticks, {'solarpanel1': solar_profile}, arrivals)
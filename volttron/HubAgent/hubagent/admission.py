@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from .volttron_optimizer import Request
+
+
+class AdmissionControl:
+    """Decides whether a device request may be scheduled, in constant time per request.
+
+    Every device has a token bucket refilled with `rate` requests per second up to `burst`.
+    Requests beyond the bucket and requests whose id was seen among the last `memory` admitted
+    ones are rejected. While `max_waiting` requests are waiting, new ones are deferred and the
+    device may send them again after `retry_after` seconds.
+    """
+
+    def __init__(self, rate: float, burst: int, max_waiting: int, memory: int = 10000, retry_after: float = 60.0):
+        self.rate: float = rate
+        self.burst: int = burst
+        self.max_waiting: int = max_waiting
+        self.memory: int = memory
+        self.retry_after: float = retry_after
+        self.buckets: Dict[Hashable, Tuple[float, float]] = {}  # device -> (tokens, time)
+        self.seen: OrderedDict = OrderedDict()  # ids of admitted requests, oldest first
+        self.admitted: int = 0
+        self.rejected: int = 0
+        self.deferred: int = 0
+
+    def admit(self, device: Hashable, request: Request, waiting: int) -> Optional[dict]:
+        """Returns None when the request is admitted, otherwise the response for the device."""
+        if request.request_id in self.seen:
+            self.rejected += 1
+            return {'status': 'rejected', 'reason': 'duplicate'}
+
+        now = time.time()
+        tokens, last = self.buckets.get(device, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self.buckets[device] = (tokens, now)
+            self.rejected += 1
+            return {'status': 'rejected', 'reason': 'rate'}
+
+        if waiting >= self.max_waiting:
+            self.buckets[device] = (tokens, now)
+            self.deferred += 1
+            return {'status': 'deferred', 'reason': 'busy', 'retry_after': self.retry_after}
+
+        self.buckets[device] = (tokens - 1, now)
+        self.seen[request.request_id] = None
+        if len(self.seen) > self.memory:
+            self.seen.popitem(last=False)
+        self.admitted += 1
+        return None
+
+    def metrics(self) -> dict:
+        return {'requests_admitted': self.admitted, 'requests_rejected': self.rejected,
+                'requests_deferred': self.deferred}
@@ -12,16 +12,40 @@ from dataclasses import dataclass
 
 import numpy as np
 from itertools import product
-import threading
+from collections import defaultdict
+from gevent.lock import RLock
 import time
 
 from typing import List, Dict
 from .volttron_optimizer import *
+from .persistence import HubStore
+from .cluster import HubCluster, site_id
+from .feeder import FeederCoordinator
+from .driver import TickDriver
+from .ingestion import IngestionQueue, ProfileDeadband, SourceSync
+from .wire import decode_profile
+from .query import HubQuery
+from .reporting import ResultFilter
+from .permits import StartPermits
+from .admission import AdmissionControl
+from .trace import TraceRecorder
 
 _log = logging.getLogger(__name__)
 vutils.setup_logging()
 __version__ = "0.1"
 
+SCHEDULERS = {
+    'BruteForceScheduler': BruteForceScheduler,
+    'LinearProgrammingScheduler': LinearProgrammingScheduler,
+    'GreedyScheduler': GreedyScheduler,
+}
+
+
+def parse_requests(message):
+    """Returns requests carried by a message, either a single one or a list of them."""
+    items = message[0] if isinstance(message[0], list) else [message[0]]
+    return [Request(item['id'], item['device'], decode_profile(item['profile']), item['timeout']) for item in items]
+
 
 
 
@@ -45,9 +69,49 @@ def hubagent(config_path, **kwargs):
 
     setting1 = int(config.get('setting1', 1))
     setting2 = config.get('setting2', "some/random/topic")
+    state_dir = config.get('state_dir', "")
+    trace_path = config.get('trace_path', "")
+    snapshot_interval = int(config.get('snapshot_interval', 60))
+    multi_site = bool(config.get('multi_site', False))
+    scheduler_workers = config.get('scheduler_workers')
+    feeder_limit = config.get('feeder_limit')
+    tick_period = float(config.get('tick_period', 1.0))
+    ingest_window = float(config.get('ingest_window', 0.5))
+    source_window = float(config.get('source_window', 1.0))
+    source_tolerance = float(config.get('source_tolerance', 0.1))
+    results_deadband = float(config.get('results_deadband', 0.01))
+    results_heartbeat = int(config.get('results_heartbeat', 60))
+    device_triggers = bool(config.get('device_triggers', True))
+    permit_retry_period = float(config.get('permit_retry_period', 2.0))
+    permit_max_retries = int(config.get('permit_max_retries', 5))
+    request_rate = float(config.get('request_rate', 0.1))
+    request_burst = int(config.get('request_burst', 5))
+    max_waiting = int(config.get('max_waiting', 50))
+    scheduler_slo = float(config.get('scheduler_slo', 0.5))
+    schedulers = list(config.get('schedulers', list(SCHEDULERS)))
 
     return Hubagent(setting1,
                           setting2,
+                          state_dir,
+                          snapshot_interval,
+                          multi_site,
+                          scheduler_workers,
+                          feeder_limit,
+                          tick_period,
+                          ingest_window,
+                          source_window,
+                          source_tolerance,
+                          results_deadband,
+                          results_heartbeat,
+                          device_triggers,
+                          permit_retry_period,
+                          permit_max_retries,
+                          request_rate,
+                          request_burst,
+                          max_waiting,
+                          scheduler_slo,
+                          schedulers,
+                          trace_path,
                           **kwargs)
 
 
@@ -57,15 +121,37 @@ class Hubagent(Agent):
     """
 
     def __init__(self, setting1=1, setting2="some/random/topic",
+                 state_dir="", snapshot_interval=60,
+                 multi_site=False, scheduler_workers=None,
+                 feeder_limit=None, tick_period=1.0, ingest_window=0.5,
+                 source_window=1.0, source_tolerance=0.1,
+                 results_deadband=0.01, results_heartbeat=60,
+                 device_triggers=True, permit_retry_period=2.0, permit_max_retries=5,
+                 request_rate=0.1, request_burst=5, max_waiting=50,
+                 scheduler_slo=0.5, schedulers=None, trace_path="",
                  **kwargs):
         super(Hubagent, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
         self.setting1 = setting1
         self.setting2 = setting2
+        self.snapshot_interval = snapshot_interval
 
         self.default_config = {"setting1": setting1,
-                               "setting2": setting2}
+                               "setting2": setting2,
+                               "snapshot_interval": snapshot_interval,
+                               "tick_period": tick_period,
+                               "ingest_window": ingest_window,
+                               "source_window": source_window,
+                               "source_tolerance": source_tolerance,
+                               "results_deadband": results_deadband,
+                               "results_heartbeat": results_heartbeat,
+                               "permit_retry_period": permit_retry_period,
+                               "permit_max_retries": permit_max_retries,
+                               "request_rate": request_rate,
+                               "request_burst": request_burst,
+                               "max_waiting": max_waiting,
+                               "scheduler_slo": scheduler_slo}
 
 
         self.sources: Dict[Device, Request] = {}
@@ -86,10 +172,55 @@ class Hubagent(Agent):
         seed0()
 
         lookahead = 6*4
-
-        scheduler = BruteForceScheduler(lookahead)
-        self.hub = Hub(scheduler, self.vip.pubsub)
+        self.lookahead = lookahead
+
+        # the exact scheduler is used while it meets the latency target, then the faster ones
+        scheduler = AdaptiveScheduler(lookahead,
+                                      [SCHEDULERS[name](lookahead) for name in schedulers or SCHEDULERS],
+                                      scheduler_slo)
+        # every device gets its start permits on its own topic and acknowledges them
+        self.permits = StartPermits(self.vip.pubsub, permit_retry_period, permit_max_retries) if device_triggers else None
+        self.hub = Hub(scheduler, self.vip.pubsub, on_start=self.permits.issue if self.permits else None)
         self.requestId = 0
+
+        self.tick_period = tick_period
+        self.ticks = 0
+        # Hub is only touched while holding the lock, by ticks and pubsub callbacks alike
+        self.lock = RLock()
+        self.driver = TickDriver(self.core, self.tick_period, self.on_tick, self.lock)
+        # floods of requests are turned away before they reach the scheduler
+        self.admission = AdmissionControl(request_rate, request_burst, max_waiting)
+        # requests arriving close together are scheduled at once
+        self.ingestion = IngestionQueue(self.core, ingest_window, self.ingest, self.lock)
+        # only the latest profile of every source is kept and small changes do not cause rescheduling
+        self.source_ingestion = IngestionQueue(self.core, source_window, self.ingest_sources, self.lock)
+        self.deadband = ProfileDeadband(source_tolerance, self.lookahead)
+        self.source_reschedules = 0
+        self.source_skips = 0
+        # sources sending a base profile followed by deltas, a gap in their sequence asks for a new base
+        self.source_sync = SourceSync()
+        self.source_resyncs = 0
+        self.consumption_reports = 0
+        self.consumption_unknown = 0  # reports of jobs no longer running
+        # results are published only when they change or a heartbeat is due
+        self.results = ResultFilter(results_deadband, results_heartbeat)
+        # answers RPC queries, cached until the Hub changes
+        self.query = HubQuery()
+        # Hub state survives restarts only when a state directory is configured
+        self.store = HubStore(state_dir, self.tick_period) if state_dir else None
+
+        # in multi-site mode every site found in topics gets its own Hub, persistence is not supported
+        self.cluster = HubCluster(scheduler, self.vip.pubsub, scheduler_workers) if multi_site else None
+        # inputs of the Hub are traced for offline replay, see trace.py
+        self.trace = TraceRecorder(trace_path) if trace_path and not multi_site else None
+        if self.cluster:
+            self.store = None
+            self.cluster.on_start = self.hub.on_start
+        # all sites share one feeder whose load must stay below the limit
+        if self.cluster and feeder_limit is not None:
+            self.cluster.coordinator = FeederCoordinator(float(feeder_limit), lookahead,
+                                                         executor=self.cluster.executor)
+
     def configure(self, config_name, action, contents):
         """
         Called after the Agent has connected to the message bus. If a configuration exists at startup
@@ -105,12 +236,42 @@ class Hubagent(Agent):
         try:
             setting1 = int(config["setting1"])
             setting2 = str(config["setting2"])
+            snapshot_interval = int(config["snapshot_interval"])
+            tick_period = float(config["tick_period"])
+            ingest_window = float(config["ingest_window"])
+            source_window = float(config["source_window"])
+            source_tolerance = float(config["source_tolerance"])
+            results_deadband = float(config["results_deadband"])
+            results_heartbeat = int(config["results_heartbeat"])
+            permit_retry_period = float(config["permit_retry_period"])
+            permit_max_retries = int(config["permit_max_retries"])
+            request_rate = float(config["request_rate"])
+            request_burst = int(config["request_burst"])
+            max_waiting = int(config["max_waiting"])
+            scheduler_slo = float(config["scheduler_slo"])
         except ValueError as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
         self.setting1 = setting1
         self.setting2 = setting2
+        self.snapshot_interval = snapshot_interval
+        self.tick_period = tick_period
+        self.driver.period = tick_period
+        if self.store:
+            self.store.tick_period = tick_period
+        self.ingestion.window = ingest_window
+        self.source_ingestion.window = source_window
+        self.deadband.tolerance = source_tolerance
+        self.results.deadband = results_deadband
+        self.results.heartbeat = results_heartbeat
+        self.admission.rate = request_rate
+        self.admission.burst = request_burst
+        self.admission.max_waiting = max_waiting
+        self.hub.scheduler.slo = scheduler_slo
+        if self.permits:
+            self.permits.retry_period = permit_retry_period
+            self.permits.max_retries = permit_max_retries
 
         self._create_subscriptions()
 
@@ -118,6 +279,12 @@ class Hubagent(Agent):
         #Unsubscribe from everything.
         self.vip.pubsub.unsubscribe("pubsub", None, None)
 
+        if self.cluster:
+            self.vip.pubsub.subscribe(peer='pubsub',
+                                      prefix="devices",
+                                      callback=self.on_site_message)
+            return
+
         self.vip.pubsub.subscribe(peer='pubsub',
                                   prefix="devices/AGH/D17/Panel/profile",
                                   callback=self.on_source_request)
@@ -126,69 +293,240 @@ class Hubagent(Agent):
                                   prefix="devices/AGH/D17/Device/request",
                                   callback=self.on_device_request)
 
+        self.vip.pubsub.subscribe(peer='pubsub',
+                                  prefix="devices/AGH/D17/Trigger/ack",
+                                  callback=self.on_trigger_ack)
+
+        self.vip.pubsub.subscribe(peer='pubsub',
+                                  prefix="devices/AGH/D17/Receiver/consumption",
+                                  callback=self.on_consumption)
+
     def _handle_publish(self, peer, sender, bus, topic, headers,
                                 message):
         pass
 
     def on_source_request(self, peer, sender, bus, topic, headers,
                             message):
-        message[0]['profile'] = np.array(message[0]['profile'])
-        #request = Request(Device(message[0]['device']), message[0]['profile'], message[0]['timeout'], message[0]['id'])
-        self.hub.update_source_profile(message[0]['device'], message[0]['profile'])
-
-        #self.sources[Device(message[0]['device'])] = request
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Receiver/all", message=
-                        [{'onOff': 1 },{'onOff':{'type':'integer','tz':'US/Pacific','units':'Watt'}}])
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Receiver/all", message=
-                        [{'onOff': 0 },{'onOff':{'type':'integer','tz':'US/Pacific','units':'Watt'}}])
+        with self.lock:
+            self.receive_source(topic, message[0])
 
     def on_device_request(self, peer, sender, bus, topic, headers,
                             message):
-        message[0]['profile'] = np.array(message[0]['profile'])
-        request = Request(message[0]['id'], message[0]['device'], message[0]['profile'], message[0]['timeout'])
-        #request = Request(Device(message[0]['device']), message[0]['profile'], message[0]['timeout'], message[0]['id'])
-        self.hub.add_request(request)
-        #self.waiting.append(request)
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Receiver/all", message=
-                        [{'onOff': 2 },{'onOff':{'type':'integer','tz':'US/Pacific','units':'Watt'}}])
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Receiver/all", message=
-                        [{'onOff': 0 },{'onOff':{'type':'integer','tz':'US/Pacific','units':'Watt'}}])
-        #self.needs_scheduling = True
+        with self.lock:
+            self.ingestion.put([(topic, request) for request in self.admit(topic, parse_requests(message))])
 
+    def on_site_message(self, peer, sender, bus, topic, headers,
+                            message):
+        with self.lock:
+            if topic.endswith("/Panel/profile"):
+                self.receive_source(topic, message[0])
+            elif topic.endswith("/Device/request"):
+                self.ingestion.put([(topic, request) for request in self.admit(topic, parse_requests(message))])
+            elif topic.endswith("/Trigger/ack") and self.permits:
+                self.permits.acknowledge(message[0]['id'])
+            elif topic.endswith("/Receiver/consumption"):
+                self.receive_consumption(topic, message[0])
+
+    def on_trigger_ack(self, peer, sender, bus, topic, headers,
+                            message):
+        with self.lock:
+            if self.permits:
+                self.permits.acknowledge(message[0]['id'])
+
+    def on_consumption(self, peer, sender, bus, topic, headers,
+                            message):
+        with self.lock:
+            self.receive_consumption(topic, message[0])
+
+    def receive_consumption(self, topic, records):
+        """Feeds energy measured by receivers into running jobs, see Hub.report_consumption.
+        The next schedule takes the corrected load into account."""
+        hub = self.cluster.hubs.get(site_id(topic)) if self.cluster else self.hub
+        for record in records:
+            request_id, values, finished = int(record['id']), decode_profile(record['values']), record.get('finished', False)
+            if not (hub and hub.report_consumption(request_id, record['tick'], values, finished)):
+                self.consumption_unknown += 1
+                continue
+            self.consumption_reports += 1
+            if self.store:
+                self.store.record_consumption(request_id, record['tick'], values, finished)
+            if self.trace:
+                self.trace.record_consumption(request_id, record['tick'], values, finished)
+
+    def admit(self, topic, requests):
+        """Returns requests admitted for scheduling, the others are answered on the response topic."""
+        site = site_id(topic)
+        hub = self.cluster.hubs.get(site) if self.cluster else self.hub
+        waiting = (len(hub.waiting_requests) if hub else 0) + len(self.ingestion.pending)
+        admitted = []
+        for request in requests:
+            response = self.admission.admit((site, request.device_name), request, waiting)
+            if response is None:
+                admitted.append(request)
+                waiting += 1
+                continue
+            response.update(id=str(request.request_id), device=request.device_name)
+            self.vip.pubsub.publish('pubsub', topic.rsplit('/', 1)[0] + "/response", message=[response])
+        return admitted
+
+    def receive_source(self, topic, item):
+        source_name = item['device']
+        if 'seq' not in item:
+            self.source_ingestion.put([(topic, source_name, decode_profile(item['profile']))])
+            return
+
+        # base profiles and deltas are applied to the Hub right away, in order,
+        # and the ingestion queue only decides about rescheduling
+        hub = self.cluster.hub(site_id(topic)) if self.cluster else self.hub
+        hub_tick = self.cluster.ticks if self.cluster else self.driver.ticks
+        source = (site_id(topic), source_name)
+
+        if 'profile' in item:
+            self.source_sync.base(source, item['seq'], item['tick'], hub_tick)
+            # deltas are applied in place, so the Hub gets its own copy
+            hub.update_source_profile(source_name, np.array(decode_profile(item['profile'])), autoschedule=False)
+            self.source_ingestion.put([(topic, source_name, None)])
+            return
+
+        shift = self.source_sync.shift(source, item['seq'], item['tick'], hub_tick)
+        if shift is not None and source_name in hub.source_profiles:
+            try:
+                hub.patch_source_profile(source_name, shift,
+                                         np.array(item['indices'], dtype=int),
+                                         np.array(item['values'], dtype=float),
+                                         decode_profile(item['tail']), autoschedule=False)
+                self.source_ingestion.put([(topic, source_name, None)])
+                return
+            except IndexError:
+                self.source_sync.reset(source)
+
+        self.source_resyncs += 1
+        self.vip.pubsub.publish('pubsub', topic.rsplit('/', 1)[0] + "/resync", message=[{'device': source_name}])
+
+    def ingest_sources(self, batch):
+        latest = {(topic, source_name): profile for topic, source_name, profile in batch}
+        # None stands for a profile already updated in place by a delta
+        for (topic, source_name), profile in latest.items():
+            if profile is None:
+                hub = self.cluster.hub(site_id(topic)) if self.cluster else self.hub
+                latest[topic, source_name] = hub.source_profiles[source_name]
+        tick = self.driver.ticks
+
+        if self.cluster:
+            for (topic, source_name), profile in latest.items():
+                source = (site_id(topic), source_name)
+                changed = self.deadband.changed(source, profile, tick)
+                if changed:
+                    self.deadband.accept(source, profile, tick)
+                self.cluster.update_source_profile(topic, source_name, profile, reschedule=changed)
+                self.source_reschedules += changed
+                self.source_skips += not changed
+            return
+
+        changed = any(self.deadband.changed(source_name, profile, tick)
+                      for (topic, source_name), profile in latest.items())
+        for (topic, source_name), profile in latest.items():
+            self.hub.update_source_profile(source_name, profile, autoschedule=False)
+            if self.store:
+                self.store.record_source(source_name, profile)
+            if self.trace:
+                self.trace.record_source(source_name, profile)
+
+        if not changed:
+            self.source_skips += 1
+            return
+        self.source_reschedules += 1
+        self.hub.schedule()
+        for source_name, profile in self.hub.source_profiles.items():
+            self.deadband.accept(source_name, profile, tick)
+        if self.store:
+            self.store.record_plan(self.hub.plan)
+        if self.trace:
+            self.trace.record_schedule(self.hub)
+
+    def ingest(self, batch):
+        if self.cluster:
+            requests = defaultdict(list)
+            for topic, request in batch:
+                requests[topic].append(request)
+            for topic in requests:
+                self.cluster.add_requests(topic, requests[topic])
+            return
+
+        requests = [request for topic, request in batch]
+        self.hub.add_requests(requests)
+        if self.store:
+            for request in requests:
+                self.store.record_request(request)
+            self.store.record_plan(self.hub.plan)
+        if self.trace:
+            for request in requests:
+                self.trace.record_request(request)
+            self.trace.record_schedule(self.hub)
     
 
 
     
     def report_results(self):
-        print('PLAN', self.hub.plan)
-        if(len(self.hub.available_energy) > 0):
-            available_energy = self.hub.available_energy[0]
-        else:
-            available_energy = 0.0
-
-        if(len(self.hub.assigned_energy) > 0):
-            assigned_energy = self.hub.assigned_energy[0]
-        else:
-            assigned_energy = 0.0
+        if self.cluster:
+            for site, hub in self.cluster.hubs.items():
+                self.publish_results(hub, "devices/{}/Results/all".format(site))
+            return
 
-        if(len(self.hub.planned_energy) > 0):
-            planned_energy = self.hub.planned_energy[0]
-        else:
-            planned_energy = 0.0
+        self.publish_results(self.hub, "devices/AGH/D17/Results/all")
 
+    def publish_results(self, hub, topic):
+        available_energy, assigned_energy, planned_energy = hub.current_tick_summary()
+        values = {'available_energy': available_energy ,'assigned_energy': assigned_energy ,'planned_energy': planned_energy }
+        diff = self.results.update(topic, values, hub.plan, *hub.take_events(), self.driver.ticks)
+        if diff is None:
+            return
 
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Results/all", message=
-                    [{'available_energy': available_energy ,'assigned_energy': assigned_energy ,'planned_energy': planned_energy },{'available_energy':{'type':'float','tz':'US/Pacific','units':'Watt'},'assigned_energy':{'type':'float','tz':'US/Pacific','units':'Watt'},'planned_energy':{'type':'float','tz':'US/Pacific','units':'Watt'}}])
+        self.vip.pubsub.publish('pubsub', topic, message=
+                    [{**values, **diff},{'available_energy':{'type':'float','tz':'US/Pacific','units':'Watt'},'assigned_energy':{'type':'float','tz':'US/Pacific','units':'Watt'},'planned_energy':{'type':'float','tz':'US/Pacific','units':'Watt'},
+                                         'added':{'type':'object','tz':'US/Pacific','units':'ticks'},'moved':{'type':'object','tz':'US/Pacific','units':'ticks'},'started':{'type':'object','tz':'US/Pacific','units':'requests'},
+                                         'finished':{'type':'object','tz':'US/Pacific','units':'requests'},'removed':{'type':'object','tz':'US/Pacific','units':'requests'}}])
 
 
-    def routine(self):
-        while True:
-            try:
-                self.hub.tick()
-                self.report_results()
-            except Exception as e:
-                print(e)
-            time.sleep(1)
+    def on_tick(self):
+        if self.cluster:
+            self.cluster.tick()
+        else:
+            if self.trace:
+                self.trace.record_tick()
+            self.hub.tick()
+        if self.permits:
+            self.permits.retry()
+        self.save_state()
+        self.report_results()
+        self.report_metrics()
+
+    def report_metrics(self):
+        metrics = {**self.driver.metrics(), **self.ingestion.metrics(),
+                   'source_reschedules': self.source_reschedules, 'source_skips': self.source_skips,
+                   'source_resyncs': self.source_resyncs, **self.results.metrics(),
+                   'consumption_reports': self.consumption_reports, 'consumption_unknown': self.consumption_unknown,
+                   **self.admission.metrics(), **(self.permits.metrics() if self.permits else {})}
+        meta = {name: {'type': 'float', 'tz': 'US/Pacific', 'units': 'seconds'} for name in metrics}
+        meta['tick'] = meta['overruns'] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'ticks'}
+        meta['batches'] = meta['batch_size'] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'requests'}
+        meta['source_reschedules'] = meta['source_skips'] = meta['source_resyncs'] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'updates'}
+        meta['consumption_reports'] = meta['consumption_unknown'] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'reports'}
+        meta['results_published'] = meta['results_suppressed'] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'publishes'}
+        meta['requests_admitted'] = meta['requests_rejected'] = meta['requests_deferred'] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'requests'}
+        for name in metrics:
+            if name.startswith('permit') or name.startswith('start_latency'):
+                meta[name] = {'type': 'integer', 'tz': 'US/Pacific', 'units': 'permits'}
+        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Metrics/all", message=[metrics, meta])
+
+    def save_state(self):
+        if not self.store:
+            return
+        self.ticks += 1
+        if self.ticks % self.snapshot_interval == 0:
+            self.store.save_snapshot(self.hub)
+        else:
+            self.store.record_tick()
 
 
 
@@ -207,8 +545,19 @@ class Hubagent(Agent):
 
         #Exmaple RPC call
         #self.vip.rpc.call("some_agent", "some_method", arg1, arg2)
-        
-        threading.Thread(target=self.routine, daemon=True).start()
+
+        if self.store:
+            with self.lock:
+                missed_ticks = self.store.restore(self.hub)
+                if self.trace and missed_ticks:
+                    # the trace goes on from the state before the restart
+                    for tick in range(missed_ticks):
+                        self.trace.record_tick()
+                    if self.hub.waiting_requests:
+                        self.trace.record_schedule(self.hub)
+            _log.info("Restored Hub state, {} ticks missed".format(missed_ticks))
+
+        self.driver.start()
 
     @Core.receiver("onstop")
     def onstop(self, sender, **kwargs):
@@ -216,15 +565,49 @@ class Hubagent(Agent):
         This method is called when the Agent is about to shutdown, but before it disconnects from
         the message bus.
         """
-        pass
+        self.driver.stop()
+        if self.store:
+            self.store.close()
+        if self.trace:
+            self.trace.close()
+        if self.cluster:
+            self.cluster.close()
+
+    def query_hub(self, site):
+        if self.cluster:
+            return self.cluster.hubs[site]
+        return self.hub
+
+    @RPC.export
+    def get_plan(self, site=None):
+        """
+        Returns offsets of waiting requests keyed by request id.
+
+        May be called from another agent via self.vip.rpc.call """
+        with self.lock:
+            return self.query.plan(self.query_hub(site), site)
+
+    @RPC.export
+    def get_energy(self, start=0, stop=None, dtype='float32', site=None):
+        """
+        Returns source, assigned, available and planned energy over ticks [start, stop),
+        each one encoded with wire.encode_profile. """
+        with self.lock:
+            return self.query.energy(self.query_hub(site), start, stop, dtype, site)
 
     @RPC.export
-    def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
+    def get_request_status(self, request_id, site=None):
         """
-        RPC method
+        Returns status of a request: waiting, running or unknown. """
+        with self.lock:
+            return self.query.request_status(self.query_hub(site), request_id, site)
 
-        May be called from another agent via self.core.rpc.call """
-        return self.setting1 + arg1 - arg2
+    @RPC.export
+    def get_scheduler_stats(self, site=None):
+        """
+        Returns scheduler name, problem size, score of the plan and duration of the last schedule. """
+        with self.lock:
+            return self.query.scheduler_stats(self.query_hub(site), site)
 
 def main():
     """Main method called to start the agent."""
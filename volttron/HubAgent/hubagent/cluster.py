@@ -0,0 +1,141 @@
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from .volttron_optimizer import IScheduler, Hub, Request
+
+_log = logging.getLogger(__name__)
+
+
+def site_id(topic: str) -> str:
+    """Returns site identifier of a topic, e.g. 'AGH/D17' for 'devices/AGH/D17/Panel/profile'."""
+    parts = topic.split('/')
+    return '/'.join(parts[1:3])
+
+
+def _solve(scheduler: IScheduler, available_energy: np.array, requests: List[Request]) -> Tuple[Dict[int, int], str, float]:
+    # runs in a worker process, on a copy of the scheduler, so its choice and duration are sent back
+    started = time.perf_counter()
+    plan = scheduler.schedule(available_energy, requests)
+    duration = time.perf_counter() - started
+    return plan, getattr(scheduler, 'last_choice', None), getattr(scheduler, 'last_duration', duration)
+
+
+class HubCluster:
+    """Hosts independent Hubs of many sites sharing one scheduler and one pool of worker processes.
+
+    Mutations only mark a site as dirty. Dirty sites are solved in the order they became dirty,
+    at most one solve per site at a time, so a busy site cannot starve the others.
+    """
+
+    def __init__(self, scheduler: IScheduler, pubsub, max_workers: int = None, executor: Executor = None):
+        self.scheduler: IScheduler = scheduler
+        self.pubsub = pubsub
+        self.executor: Executor = executor or ProcessPoolExecutor(max_workers)
+        self.max_pending: int = getattr(self.executor, '_max_workers', None) or 1
+        self.hubs: Dict[str, Hub] = {}
+        self.ticks: int = 0
+        self._versions: Dict[str, int] = {}
+        self._dirty: OrderedDict = OrderedDict()
+        self._pending: Dict[str, Tuple[Future, int, int, List[Request]]] = {}  # site -> (future, version, tick, requests)
+        self.coordinator = None  # FeederCoordinator solving all sites together, if any
+        self.last_coordination = None
+        self.on_start = None  # given to every new Hub, see Hub.on_start
+
+    def hub(self, site: str) -> Hub:
+        if site not in self.hubs:
+            self.hubs[site] = Hub(self.scheduler, self.pubsub, trigger_topic=f"devices/{site}/Trigger/all",
+                                  on_start=self.on_start)
+            self._versions[site] = 0
+        return self.hubs[site]
+
+    def update_source_profile(self, topic: str, source_name: str, profile: np.array, reschedule: bool = True) -> None:
+        site = site_id(topic)
+        self.hub(site).update_source_profile(source_name, profile, autoschedule=False)
+        if reschedule:
+            self._mark_dirty(site)
+
+    def add_requests(self, topic: str, requests: List[Request]) -> None:
+        site = site_id(topic)
+        hub = self.hub(site)
+        hub.add_requests(requests, autoschedule=False)
+        # until the solve comes back requests are held as long as their timeout allows
+        plan = dict(hub.plan)
+        plan.update({request.request_id: request.timeout for request in requests})
+        hub.apply_plan(plan)
+        self._mark_dirty(site)
+
+    def tick(self) -> None:
+        self.collect()
+        for hub in self.hubs.values():
+            hub.tick()
+        self.ticks += 1
+        self.submit()
+
+    def submit(self) -> None:
+        """Starts solves of dirty sites while there are idle workers."""
+        if self.coordinator:
+            # sites sharing a feeder cannot be solved independently, their coordination
+            # runs for a bounded time every tick until it is over
+            if self._dirty and not self.coordinator.active:
+                self._dirty.clear()
+                self.coordinator.start(self.hubs, self.ticks)
+            if self.coordinator.active:
+                result = self.coordinator.step(self.ticks)
+                if result is not None:
+                    self.last_coordination = result
+                    _log.info("Feeder coordination took {} rounds, converged: {}".format(
+                        result.rounds, result.converged))
+            return
+
+        while self._dirty and len(self._pending) < self.max_pending:
+            site, _ = self._dirty.popitem(last=False)
+            hub = self.hubs[site]
+            if not hub.waiting_requests:
+                continue
+            requests = list(hub.waiting_requests)
+            future = self.executor.submit(_solve, self.scheduler, hub.available_energy, requests)
+            self._pending[site] = (future, self._versions[site], self.ticks, requests)
+
+    def collect(self) -> None:
+        """Applies plans of finished solves without waiting for the others."""
+        for site, (future, version, tick, requests) in list(self._pending.items()):
+            if not future.done():
+                continue
+            del self._pending[site]
+            hub = self.hubs[site]
+
+            if future.exception() is not None:
+                _log.error("Scheduling of site {} failed: {}".format(site, future.exception()))
+                continue
+
+            # the plan was computed a few ticks ago, requests started meanwhile are gone
+            # and requests added meanwhile keep their current offsets until the next solve
+            result, choice, duration = future.result()
+            if choice is not None and hasattr(self.scheduler, 'observe') and isinstance(self.executor, ProcessPoolExecutor):
+                # workers solve with copies of the scheduler, which learn solve times for nobody,
+                # while threads would share the scheduler and it has learned already
+                self.scheduler.observe(choice, requests, duration)
+            hub.last_schedule_duration = duration
+
+            elapsed = self.ticks - tick
+            plan = dict(hub.plan)
+            for request_id, offset in result.items():
+                if request_id in plan:
+                    plan[request_id] = max(offset - elapsed, 0)
+            hub.apply_plan(plan)
+
+            if self._versions[site] != version:
+                self._dirty[site] = None
+
+    def _mark_dirty(self, site: str) -> None:
+        self._versions[site] += 1
+        if site not in self._pending:
+            self._dirty[site] = None
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,95 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+_log = logging.getLogger(__name__)
+
+
+class TickDriver:
+    """Calls `callback` every `period` seconds using the agent's core scheduler.
+
+    Deadlines are absolute (start + n * period, counted from the last change of the period),
+    so time spent in the callback does not accumulate as drift. When a tick overruns, the missed deadlines are ticked right away
+    so that Hub time keeps up with wall clock time.
+    """
+
+    def __init__(self, core, period: float, callback: Callable[[], None], lock):
+        self.core = core
+        self._period: float = period
+        self.callback: Callable[[], None] = callback
+        self.lock = lock  # serializes Hub access with pubsub callbacks
+
+        self.start_time: float = None
+        self.ticks: int = 0  # never reset, the agent uses it as the Hub's tick
+        # deadlines are counted from the last period change
+        self._base_time: float = None
+        self._base_ticks: int = 0
+        self.overruns: int = 0
+        self.last_duration: float = 0.0
+        self.max_duration: float = 0.0
+        self.last_lateness: float = 0.0
+        self._event = None
+
+    def start(self) -> None:
+        self.start_time = self._base_time = time.time()
+        self.ticks = self._base_ticks = 0
+        self._schedule_next()
+
+    def stop(self) -> None:
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    @property
+    def period(self) -> float:
+        return self._period
+
+    @period.setter
+    def period(self, period: float) -> None:
+        """Deadlines are counted anew from now, otherwise they would jump with the period."""
+        if period == self._period:
+            return
+        self._period = period
+        if self._base_time is None:
+            return
+        self._base_time = time.time()
+        self._base_ticks = self.ticks
+        if self._event is not None:
+            self._event.cancel()
+            self._schedule_next()
+
+    @property
+    def next_deadline(self) -> float:
+        return self._base_time + (self.ticks - self._base_ticks + 1) * self.period
+
+    def _schedule_next(self) -> None:
+        deadline = datetime.fromtimestamp(self.next_deadline, tz=timezone.utc)
+        self._event = self.core.schedule(deadline, self._run)
+
+    def _run(self) -> None:
+        started = time.time()
+        self.last_lateness = started - self.next_deadline
+        self.ticks += 1
+
+        try:
+            with self.lock:
+                self.callback()
+        except Exception:
+            _log.exception("Tick {} failed".format(self.ticks))
+
+        self.last_duration = time.time() - started
+        self.max_duration = max(self.max_duration, self.last_duration)
+        if time.time() > self.next_deadline:
+            self.overruns += 1
+
+        self._schedule_next()
+
+    def metrics(self) -> dict:
+        return {
+            'tick': self.ticks,
+            'tick_duration': self.last_duration,
+            'max_tick_duration': self.max_duration,
+            'tick_lateness': self.last_lateness,
+            'overruns': self.overruns,
+        }
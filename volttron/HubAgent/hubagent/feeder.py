@@ -0,0 +1,174 @@
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, replace
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from . import utils
+from .volttron_optimizer import IScheduler, Hub, Request, profile_columns, scatter_profiles
+
+
+def _solve(scheduler: IScheduler, available_energy: np.array, requests: List[Request], prices: np.array) -> Dict[int, int]:
+    # runs in a worker process
+    return scheduler.schedule(available_energy, requests, prices=prices)
+
+
+@dataclass
+class CoordinationResult:
+    rounds: int
+    converged: bool
+    prices: np.array  # feeder price per tick in the round that gave the applied plans
+    load: np.array  # aggregate net load per tick under the applied plans
+
+
+@dataclass
+class _SiteProblem:
+    # a hub's problem as it was when the coordination started
+    scheduler: IScheduler
+    available_energy: np.array
+    requests: List[Request]
+
+
+class FeederCoordinator:
+    """Keeps the aggregate load of hubs sharing a feeder below its limit by dual decomposition.
+
+    Every round hubs re-solve their own problems in parallel with a per-tick price of consumed
+    energy, then the price is raised where the aggregate load exceeds the limit (subgradient step)
+    and lowered elsewhere, until the limit is respected or max_rounds is reached. Only a random
+    part of hubs re-solves after the first round, otherwise similar hubs move their load to the
+    same cheap ticks together and prices oscillate. The best plans seen are applied to the hubs.
+
+    A coordination solves the hubs' problems as they were at `start` and runs in `step`s,
+    each one spending at most `budget` seconds, so rounds spread over ticks without
+    blocking them. Plans are shifted by the ticks elapsed meanwhile when applied.
+    """
+
+    def __init__(self, limit: float, lookahead: int, step: float = 0.5, max_rounds: int = 50,
+                 participation: float = 0.5, executor: Executor = None, seed: int = 0, budget: float = 0.1):
+        self.limit: float = limit
+        self.lookahead: int = lookahead
+        self.step_size: float = step
+        self.max_rounds: int = max_rounds
+        self.participation: float = participation
+        self.executor: Executor = executor or ProcessPoolExecutor()
+        self.rng = np.random.default_rng(seed)
+        self.budget: float = budget  # seconds per step
+
+        self._hubs: Dict[str, Hub] = None  # of the running coordination, None when idle
+        self._problems: Dict[str, _SiteProblem] = {}
+        self._started: int = 0  # tick
+        self._fixed_load: np.array = None
+        self._futures: Dict[str, Future] = {}
+        self._plans: Dict[str, Dict[int, int]] = {}
+        self._prices: np.array = None
+        self._rounds: int = 0
+        self._best = None  # (plans, load, excess, prices)
+
+    @property
+    def active(self) -> bool:
+        return self._hubs is not None
+
+    def net_load(self, available_energy: np.array, requests: List[Request], plan: Dict[int, int]) -> np.array:
+        """Energy a hub draws from the feeder in every tick, negative when it feeds in."""
+        load = -utils.pad(available_energy, self.lookahead)
+        if requests:
+            values, lengths = profile_columns(requests)
+            offsets = np.array([plan[request.request_id] for request in requests], dtype=int)
+            load += scatter_profiles(values, lengths, offsets, self.lookahead)[0]
+        return load
+
+    def coordinate(self, hubs: Dict[str, Hub]) -> CoordinationResult:
+        """Runs a whole coordination at once."""
+        self.start(hubs, 0)
+        result = None
+        while result is None:
+            result = self.step(0, budget=np.inf)
+        return result
+
+    def start(self, hubs: Dict[str, Hub], tick: int) -> None:
+        # hubs without waiting requests cannot move their load
+        self._fixed_load = sum(
+            (-utils.pad(hub.available_energy, self.lookahead) for hub in hubs.values() if not hub.waiting_requests),
+            np.zeros(self.lookahead))
+        self._hubs = {site: hub for site, hub in hubs.items() if hub.waiting_requests}
+        # requests count their timeouts down on every tick, so the problems keep copies
+        self._problems = {
+            site: _SiteProblem(hub.scheduler, np.array(hub.available_energy),
+                               [replace(request) for request in hub.waiting_requests])
+            for site, hub in self._hubs.items()
+        }
+        self._plans = {site: dict(hub.plan) for site, hub in self._hubs.items()}
+        self._started = tick
+        self._prices = np.zeros(self.lookahead)
+        self._rounds = 0
+        self._best = None
+        if self._hubs:
+            self._submit_round()
+
+    def step(self, tick: int, budget: float = None) -> Optional[CoordinationResult]:
+        """Advances the running coordination for at most `budget` seconds.
+        Returns its result once it has finished, otherwise None."""
+        if not self._hubs:
+            return self._finish(tick)
+
+        deadline = time.perf_counter() + (self.budget if budget is None else budget)
+        while True:
+            remaining = deadline - time.perf_counter()
+            done, pending = wait(self._futures.values(), timeout=None if np.isinf(remaining) else max(remaining, 0))
+            if pending:
+                return None  # the round goes on in the next step
+            if self._end_round():
+                return self._finish(tick)
+            self._submit_round()
+            if time.perf_counter() >= deadline:
+                return None
+
+    def _submit_round(self) -> None:
+        self._rounds += 1
+        sites = list(self._problems) if self._rounds == 1 else [
+            site for site in self._problems if self.rng.random() < self.participation]
+        self._futures = {
+            site: self.executor.submit(
+                _solve, self._problems[site].scheduler, self._problems[site].available_energy,
+                self._problems[site].requests, self._prices)
+            for site in sites
+        }
+
+    def _end_round(self) -> bool:
+        """Takes plans of the finished round, returns True when the coordination is over."""
+        self._plans = {**self._plans, **{site: future.result() for site, future in self._futures.items()}}
+        self._futures = {}
+
+        load = self._fixed_load + sum(
+            (self.net_load(problem.available_energy, problem.requests, self._plans[site])
+             for site, problem in self._problems.items()),
+            np.zeros(self.lookahead))
+        excess = load - self.limit
+
+        if self._best is None or excess.max() < self._best[2]:
+            self._best = (self._plans, load, excess.max(), self._prices)
+        if excess.max() <= 0 or self._rounds >= self.max_rounds:
+            return True
+
+        self._prices = np.maximum(self._prices + self.step_size * excess, 0)
+        return False
+
+    def _finish(self, tick: int) -> CoordinationResult:
+        hubs, self._hubs = self._hubs, None
+        if not hubs:
+            return CoordinationResult(0, bool(self._fixed_load.max() <= self.limit),
+                                      np.zeros(self.lookahead), self._fixed_load)
+
+        best_plans, best_load, best_excess, best_prices = self._best
+        # the plans were computed a few ticks ago, requests started meanwhile are gone
+        # and requests added meanwhile keep their current offsets until the next coordination
+        elapsed = tick - self._started
+        for site, plan in best_plans.items():
+            current = dict(hubs[site].plan)
+            for request_id, offset in plan.items():
+                if request_id in current:
+                    current[request_id] = max(offset - elapsed, 0)
+            hubs[site].apply_plan(current)
+
+        return CoordinationResult(self._rounds, bool(best_excess <= 0), best_prices, best_load)
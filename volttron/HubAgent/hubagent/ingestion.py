@@ -0,0 +1,121 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from . import utils
+
+_log = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """Collects items arriving within `window` seconds and hands them over as one batch.
+
+    The window opens with the first item of a batch, so no item waits longer than `window`.
+    A zero window hands every item over right away.
+    """
+
+    def __init__(self, core, window: float, callback: Callable[[List[Any]], None], lock):
+        self.core = core
+        self.window: float = window
+        self.callback: Callable[[List[Any]], None] = callback
+        self.lock = lock
+
+        self.pending: List[Any] = []
+        self.opened: float = None
+        self.batches: int = 0
+        self.last_size: int = 0
+        self.last_latency: float = 0.0
+        self.max_latency: float = 0.0
+
+    def put(self, items: List[Any]) -> None:
+        if not items:
+            return
+        if not self.pending:
+            self.opened = time.time()
+            if self.window > 0:
+                deadline = datetime.fromtimestamp(self.opened + self.window, tz=timezone.utc)
+                self.core.schedule(deadline, self.flush)
+        self.pending.extend(items)
+        if self.window <= 0:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            try:
+                self.callback(batch)
+            except Exception:
+                _log.exception("Ingestion of {} items failed".format(len(batch)))
+
+            self.batches += 1
+            self.last_size = len(batch)
+            self.last_latency = time.time() - self.opened
+            self.max_latency = max(self.max_latency, self.last_latency)
+
+    def metrics(self) -> dict:
+        return {
+            'batches': self.batches,
+            'batch_size': self.last_size,
+            'batch_latency': self.last_latency,
+            'max_batch_latency': self.max_latency,
+        }
+
+
+class ProfileDeadband:
+    """Tells whether a source profile differs from the one last scheduled with by more than
+    `tolerance` on average over the lookahead window. The earlier profile is shifted by the
+    ticks elapsed since, so an unchanged forecast does not count as a change."""
+
+    def __init__(self, tolerance: float, lookahead: int):
+        self.tolerance: float = tolerance
+        self.lookahead: int = lookahead
+        self.baselines: Dict[Hashable, Tuple[np.array, int]] = {}
+
+    def changed(self, source: Hashable, profile: np.array, tick: int) -> bool:
+        if source not in self.baselines:
+            return True
+        baseline, since = self.baselines[source]
+        baseline = utils.pad(baseline[tick-since:], self.lookahead)
+        return np.abs(utils.pad(profile, self.lookahead) - baseline).mean() > self.tolerance
+
+    def accept(self, source: Hashable, profile: np.array, tick: int) -> None:
+        # copied, as deltas update profiles in place
+        self.baselines[source] = (np.array(profile), tick)
+
+
+class SourceSync:
+    """Follows sequence numbers and tick indices of delta-encoded source profiles.
+
+    Sources publish a base profile followed by deltas, each one numbered and stamped with
+    the source's tick at the head of the profile. The Hub shifts profiles by its own ticks,
+    so for every source the difference between both clocks is kept to align the deltas.
+    """
+
+    def __init__(self):
+        self.sources: Dict[Hashable, Tuple[int, int]] = {}  # source -> (sequence number, tick offset)
+
+    def base(self, source: Hashable, seq: int, tick: int, hub_tick: int) -> None:
+        self.sources[source] = (seq, tick - hub_tick)
+
+    def shift(self, source: Hashable, seq: int, tick: int, hub_tick: int) -> Optional[int]:
+        """Returns how many leading samples the Hub's profile must drop before the delta is applied,
+        or None when a delta was missed and the source has to resend its base profile.
+        The shift is negative when the Hub ticked more often than the source published, then
+        the Hub's profile already starts that many samples after the delta's first one."""
+        if source not in self.sources:
+            return None
+        last_seq, offset = self.sources.pop(source)
+        if seq != last_seq + 1:
+            return None
+        shift = tick - (offset + hub_tick)
+        # the head of the Hub's profile stays where it is when the shift is negative
+        self.sources[source] = (seq, max(tick, offset + hub_tick) - hub_tick)
+        return shift
+
+    def reset(self, source: Hashable) -> None:
+        self.sources.pop(source, None)
@@ -0,0 +1,78 @@
+import logging
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict
+
+from .volttron_optimizer import Request
+
+_log = logging.getLogger(__name__)
+
+
+@dataclass
+class Permit:
+    topic: str
+    message: dict
+    issued: float  # time the Hub started the request
+    sent: float
+    attempts: int = 1
+
+
+class StartPermits:
+    """Delivers start permits to devices on their own trigger topics.
+
+    A device acknowledges a permit by its request id. Permits not acknowledged within
+    `retry_period` seconds are sent again, at most `max_retries` times. Time from the start
+    of a request to its acknowledgement is counted in a histogram of `LATENCY_BUCKETS`.
+    """
+
+    LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+
+    def __init__(self, pubsub, retry_period: float, max_retries: int):
+        self.pubsub = pubsub
+        self.retry_period: float = retry_period
+        self.max_retries: int = max_retries
+        self.pending: Dict[str, Permit] = {}
+        self.latencies = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        self.retries: int = 0
+        self.failures: int = 0
+
+    def issue(self, topic: str, request: Request) -> None:
+        now = time.time()
+        message = {'trigger': 1, 'device': request.device_name, 'id': str(request.request_id)}
+        permit = self.pending[message['id']] = Permit(topic, message, now, now)
+        self._send(permit)
+
+    def acknowledge(self, request_id) -> bool:
+        permit = self.pending.pop(str(request_id), None)
+        if permit is None:
+            return False  # acknowledged before or given up
+        self.latencies[bisect_left(self.LATENCY_BUCKETS, time.time() - permit.issued)] += 1
+        return True
+
+    def retry(self) -> None:
+        now = time.time()
+        for request_id, permit in list(self.pending.items()):
+            if now - permit.sent < self.retry_period:
+                continue
+            if permit.attempts > self.max_retries:
+                del self.pending[request_id]
+                self.failures += 1
+                _log.warning("Device {} did not acknowledge start of request {}".format(
+                    permit.message['device'], request_id))
+                continue
+            permit.sent = now
+            permit.attempts += 1
+            self.retries += 1
+            self._send(permit)
+
+    def _send(self, permit: Permit) -> None:
+        self.pubsub.publish('pubsub', permit.topic, message=
+                        [permit.message, {'trigger':{'type':'integer','tz':'US/Pacific','units':'Trigger'},'device':{'type':'string','tz':'US/Pacific','units':'device_name'},'id':{'type':'string','tz':'US/Pacific','units':'request_id'}}])
+
+    def metrics(self) -> dict:
+        metrics = {'permits_pending': len(self.pending), 'permit_retries': self.retries, 'permit_failures': self.failures}
+        for bound, count in zip(self.LATENCY_BUCKETS, self.latencies):
+            metrics['start_latency_le_{}'.format(bound)] = count
+        metrics['start_latency_gt_{}'.format(self.LATENCY_BUCKETS[-1])] = self.latencies[-1]
+        return metrics
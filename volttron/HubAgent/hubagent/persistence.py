@@ -0,0 +1,197 @@
+import json
+import os
+import time
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from .volttron_optimizer import Hub, Request, Job
+
+
+class _MutedPubsub:
+    # replayed ticks have already published their triggers before the restart
+    def publish(self, *args, **kwargs):
+        pass
+
+
+def _pack(profiles: List[np.array]) -> Tuple[np.array, np.array]:
+    lengths = np.array([len(profile) for profile in profiles], dtype=int)
+    values = np.concatenate(profiles) if profiles else np.array([])
+    return values, lengths
+
+
+def _unpack(values: np.array, lengths: np.array) -> List[np.array]:
+    if not len(lengths):
+        return []
+    return np.split(values, np.cumsum(lengths)[:-1])
+
+
+class HubStore:
+    """Keeps Hub state in a binary snapshot and an append-only journal of mutations.
+
+    The snapshot is a columnar .npz file (profiles of all requests, jobs and sources
+    are concatenated into single arrays), the journal is a JSON line per mutation
+    recorded since the last snapshot.
+    """
+
+    def __init__(self, directory: str, tick_period: float = 1.0):
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, 'hub_snapshot.npz')
+        self.journal_path = os.path.join(directory, 'hub_journal.jsonl')
+        self.tick_period = tick_period
+        self.journal = open(self.journal_path, 'a')
+
+    def record(self, event: str, **fields) -> None:
+        fields['event'] = event
+        fields['time'] = time.time()
+        self.journal.write(json.dumps(fields) + '\n')
+        self.journal.flush()
+
+    def record_source(self, source_name: str, profile: np.array) -> None:
+        self.record('source', source=source_name, profile=[float(x) for x in profile])
+
+    def record_request(self, request: Request) -> None:
+        self.record('request', id=request.request_id, device=request.device_name,
+                    profile=[float(x) for x in request.profile], timeout=request.timeout)
+
+    def record_plan(self, plan: Dict[int, int]) -> None:
+        # request ids do not fit JSON object keys, hence the list of pairs
+        self.record('plan', plan=list(plan.items()))
+
+    def record_consumption(self, request_id: int, tick: int, values: np.array, finished: bool) -> None:
+        self.record('consumption', id=request_id, tick=tick, values=[float(x) for x in values], finished=finished)
+
+    def record_tick(self) -> None:
+        self.record('tick')
+
+    def save_snapshot(self, hub: Hub) -> None:
+        request_values, request_lengths = _pack([request.profile for request in hub.waiting_requests])
+        job_values, job_lengths = _pack([job.profile for job in hub.running_jobs])
+        nominal_values, nominal_lengths = _pack([job.nominal for job in hub.running_jobs])
+        source_values, source_lengths = _pack(list(hub.source_profiles.values()))
+
+        # request ids are 128-bit, so they are kept as strings
+        state = {
+            'time': np.array(time.time()),
+            'request_ids': np.array([str(request.request_id) for request in hub.waiting_requests]),
+            'request_devices': np.array([request.device_name for request in hub.waiting_requests]),
+            'request_timeouts': np.array([request.timeout for request in hub.waiting_requests], dtype=int),
+            'request_offsets': np.array([hub.plan.get(request.request_id, 0) for request in hub.waiting_requests], dtype=int),
+            'request_values': request_values,
+            'request_lengths': request_lengths,
+            'job_ids': np.array([str(job.request_id) for job in hub.running_jobs]),
+            'job_devices': np.array([job.device_name for job in hub.running_jobs]),
+            'job_values': job_values,
+            'job_lengths': job_lengths,
+            'job_nominal_values': nominal_values,
+            'job_nominal_lengths': nominal_lengths,
+            'job_elapsed': np.array([job.elapsed for job in hub.running_jobs], dtype=int),
+            'job_measured': np.array([job.measured for job in hub.running_jobs]),
+            'job_expected': np.array([job.expected for job in hub.running_jobs]),
+            'source_names': np.array(list(hub.source_profiles.keys())),
+            'source_values': source_values,
+            'source_lengths': source_lengths,
+        }
+
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # everything recorded so far is covered by the snapshot
+        self.journal.close()
+        self.journal = open(self.journal_path, 'w')
+
+    def restore(self, hub: Hub) -> int:
+        """Loads the snapshot, replays the journal and catches up with the ticks
+        missed while the agent was down. Returns the number of missed ticks."""
+        last_time = self._load_snapshot(hub)
+        last_time = self._replay_journal(hub, last_time)
+        if last_time is None:
+            return 0
+
+        missed_ticks = int((time.time() - last_time) / self.tick_period)
+        if not missed_ticks:
+            return 0
+
+        for tick in range(missed_ticks):
+            if not (hub.waiting_requests or hub.running_jobs or any(map(len, hub.source_profiles.values()))):
+                break  # nothing left to tick
+            hub.tick()
+        if hub.waiting_requests:
+            hub.schedule()  # source profiles have aged meanwhile
+        return missed_ticks
+
+    def _load_snapshot(self, hub: Hub):
+        if not os.path.exists(self.snapshot_path):
+            return None
+
+        with np.load(self.snapshot_path) as state:
+            requests = [
+                Request(int(request_id), str(device_name), profile, int(timeout))
+                for request_id, device_name, profile, timeout in zip(
+                    state['request_ids'], state['request_devices'],
+                    _unpack(state['request_values'], state['request_lengths']), state['request_timeouts'])
+            ]
+            plan = {
+                request.request_id: int(offset)
+                for request, offset in zip(requests, state['request_offsets'])
+            }
+            jobs = [
+                Job(int(request_id), str(device_name), profile)
+                for request_id, device_name, profile in zip(
+                    state['job_ids'], state['job_devices'],
+                    _unpack(state['job_values'], state['job_lengths']))
+            ]
+            if 'job_elapsed' in state.files:  # older snapshots lack the progress of jobs
+                for job, nominal, elapsed, measured, expected in zip(
+                        jobs, _unpack(state['job_nominal_values'], state['job_nominal_lengths']),
+                        state['job_elapsed'], state['job_measured'], state['job_expected']):
+                    job.nominal, job.elapsed = nominal, int(elapsed)
+                    job.measured, job.expected = float(measured), float(expected)
+            source_profiles = dict(zip(
+                map(str, state['source_names']),
+                _unpack(state['source_values'], state['source_lengths'])))
+            snapshot_time = float(state['time'])
+
+        hub.load_state(source_profiles, requests, jobs, plan)
+        return snapshot_time
+
+    def _replay_journal(self, hub: Hub, last_time):
+        if not os.path.exists(self.journal_path):
+            return last_time
+
+        # replayed starts were delivered before the restart
+        pubsub, hub.pubsub = hub.pubsub, _MutedPubsub()
+        on_start, hub.on_start = hub.on_start, None
+        try:
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the end of the journal
+                    if last_time is not None and entry['time'] <= last_time:
+                        continue  # already contained in the snapshot
+
+                    if entry['event'] == 'source':
+                        hub.update_source_profile(entry['source'], np.array(entry['profile']), autoschedule=False)
+                    elif entry['event'] == 'request':
+                        request = Request(entry['id'], entry['device'], np.array(entry['profile']), entry['timeout'])
+                        hub.add_request(request, autoschedule=False)
+                    elif entry['event'] == 'plan':
+                        hub.apply_plan({request_id: offset for request_id, offset in entry['plan']})
+                    elif entry['event'] == 'consumption':
+                        hub.report_consumption(entry['id'], entry['tick'], np.array(entry['values']), entry['finished'])
+                    elif entry['event'] == 'tick':
+                        hub.tick()
+                    last_time = entry['time']
+        finally:
+            hub.pubsub = pubsub
+            hub.on_start = on_start
+        return last_time
+
+    def close(self) -> None:
+        self.journal.close()
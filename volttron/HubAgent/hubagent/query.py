@@ -0,0 +1,86 @@
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from .volttron_optimizer import Hub
+from .wire import encode_profile
+
+
+class HubQuery:
+    """Answers queries about a Hub for RPC clients.
+
+    Responses are cached until the Hub changes, which happens at the latest on its next tick,
+    so dashboards polling between ticks do not recompute anything.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries: int = max_entries
+        self._responses: Dict[Hashable, Tuple[Hub, int, Any]] = {}  # key -> (hub, version, response)
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _cached(self, hub: Hub, key: Hashable, compute: Callable[[], Any]) -> Any:
+        entry = self._responses.get(key)
+        if entry is not None and entry[0] is hub and entry[1] == hub.version:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        if len(self._responses) >= self.max_entries:
+            self._responses.clear()
+        response = compute()
+        self._responses[key] = (hub, hub.version, response)
+        return response
+
+    def plan(self, hub: Hub, site: str = None) -> Dict[str, int]:
+        """Returns offsets of waiting requests keyed by request id."""
+        return self._cached(hub, ('plan', site), lambda: {
+            str(request_id): offset for request_id, offset in hub.plan.items()})
+
+    def energy(self, hub: Hub, start: int = 0, stop: int = None, dtype: str = 'float32', site: str = None) -> dict:
+        """Returns energy curves over ticks [start, stop) encoded with wire.encode_profile."""
+        def compute():
+            curves = {
+                'source_energy': hub.source_energy,
+                'assigned_energy': hub.assigned_energy,
+                'available_energy': hub.available_energy,
+                'planned_energy': hub.planned_energy,
+            }
+            response = {name: encode_profile(curve[start:stop], dtype=dtype) for name, curve in curves.items()}
+            response['start'] = start
+            return response
+        return self._cached(hub, ('energy', site, start, stop, dtype), compute)
+
+    def request_status(self, hub: Hub, request_id, site: str = None) -> dict:
+        """Returns status of a request: waiting with its offset, running with remaining ticks, or unknown."""
+        def compute():
+            statuses = {}
+            for request in hub.waiting_requests:
+                statuses[str(request.request_id)] = {
+                    'status': 'waiting',
+                    'device': request.device_name,
+                    'offset': hub.plan.get(request.request_id),
+                    'timeout': request.timeout,
+                }
+            for job in hub.running_jobs:
+                statuses[str(job.request_id)] = {
+                    'status': 'running',
+                    'device': job.device_name,
+                    'remaining': len(job.profile),
+                    'measured': job.measured,
+                    'expected': job.expected,
+                }
+            return statuses
+        statuses = self._cached(hub, ('status', site), compute)
+        return statuses.get(str(request_id), {'status': 'unknown'})
+
+    def scheduler_stats(self, hub: Hub, site: str = None) -> dict:
+        def compute():
+            return {
+                'scheduler': type(hub.scheduler).__name__,
+                'last_scheduler': getattr(hub.scheduler, 'last_choice', None),
+                'lookahead': hub.scheduler.lookahead,
+                'waiting': len(hub.waiting_requests),
+                'running': len(hub.running_jobs),
+                'score': hub.score if hub.waiting_requests else 0.0,
+                'schedules': hub.schedules,
+                'last_schedule_duration': hub.last_schedule_duration,
+            }
+        return self._cached(hub, ('stats', site), compute)
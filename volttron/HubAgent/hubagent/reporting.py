@@ -0,0 +1,55 @@
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+
+class ResultFilter:
+    """Decides which results of a Hub are worth publishing.
+
+    Results are published when some value moved by more than `deadband` since the last publish,
+    when the plan changed, or when `heartbeat` ticks passed without a publish. Along with the
+    values goes the difference of plans: requests added, requests moved to another offset than
+    the one published before (less the ticks elapsed), requests that started running, jobs that
+    finished and requests that left the plan without starting. Starts and finishes are taken from
+    the Hub's events rather than from running jobs, as a job of one tick starts and finishes
+    within a single Hub.tick.
+    """
+
+    def __init__(self, deadband: float, heartbeat: int):
+        self.deadband: float = deadband
+        self.heartbeat: int = heartbeat
+        self.published: int = 0
+        self.suppressed: int = 0
+        self._last: Dict[Hashable, Tuple[dict, Dict[int, int], int]] = {}  # key -> (values, plan, tick)
+
+    def update(self, key: Hashable, values: Dict[str, float], plan: Dict[int, int], started: Iterable[int],
+               finished: Iterable[int], tick: int) -> Optional[dict]:
+        """Returns the plan difference when results have to be published, None otherwise.
+        `started` and `finished` are request ids since the previous update of the key."""
+        started, finished = list(started), list(finished)
+        if key in self._last:
+            last_values, last_plan, last_tick = self._last[key]
+        else:
+            last_values, last_plan, last_tick = {}, {}, None
+        elapsed = 0 if last_tick is None else tick - last_tick
+
+        diff = {
+            'added': {str(request_id): offset for request_id, offset in plan.items() if request_id not in last_plan},
+            'moved': {str(request_id): offset for request_id, offset in plan.items()
+                      if request_id in last_plan and offset != max(last_plan[request_id] - elapsed, 0)},
+            'started': [str(request_id) for request_id in started],
+            'finished': [str(request_id) for request_id in finished],
+            'removed': [str(request_id) for request_id in last_plan
+                        if request_id not in plan and request_id not in started],
+        }
+        changed = any(diff.values()) or any(
+            name not in last_values or abs(value - last_values[name]) > self.deadband
+            for name, value in values.items())
+
+        if not changed and last_tick is not None and elapsed < self.heartbeat:
+            self.suppressed += 1
+            return None
+        self.published += 1
+        self._last[key] = (dict(values), dict(plan), tick)
+        return diff
+
+    def metrics(self) -> dict:
+        return {'results_published': self.published, 'results_suppressed': self.suppressed}
@@ -0,0 +1,162 @@
+"""
+Trace of all inputs of a Hub and their offline replay.
+
+HubAgent appends an event per line to the trace file: source profiles, requests,
+consumption reports and ticks as they reach the Hub, and the plan of every solve
+with its duration. Profiles are stored losslessly in the compact encoding of `wire`.
+Unlike the persistence journal the trace is never truncated.
+
+Replaying feeds the same events into a Hub with any scheduler, solving wherever the
+agent did, and compares the plans and solve times. Run as::
+
+    python -m hubagent.trace hub_trace.jsonl --scheduler GreedyScheduler
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from . import volttron_optimizer
+from .persistence import _MutedPubsub
+from .volttron_optimizer import Hub, IScheduler, Request
+from .wire import decode_profile, encode_profile
+
+
+def _encode(profile: np.array) -> dict:
+    return encode_profile(profile, dtype='float64', delta=True, compress=True)
+
+
+class TraceRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'a')
+
+    def record(self, event: str, **fields) -> None:
+        fields['event'] = event
+        fields['time'] = time.time()
+        self.file.write(json.dumps(fields) + '\n')
+        self.file.flush()
+
+    def record_source(self, source_name: str, profile: np.array) -> None:
+        self.record('source', source=source_name, profile=_encode(profile))
+
+    def record_request(self, request: Request) -> None:
+        # request ids are 128-bit, so they are kept as strings
+        self.record('request', id=str(request.request_id), device=request.device_name,
+                    profile=_encode(request.profile), timeout=request.timeout)
+
+    def record_consumption(self, request_id: int, tick: int, values: np.array, finished: bool) -> None:
+        self.record('consumption', id=str(request_id), tick=tick, values=[float(x) for x in values], finished=finished)
+
+    def record_schedule(self, hub: Hub) -> None:
+        self.record('schedule', plan=[[str(request_id), offset] for request_id, offset in hub.plan.items()],
+                    duration=hub.last_schedule_duration, scheduler=getattr(hub.scheduler, 'last_choice', None))
+
+    def record_tick(self) -> None:
+        self.record('tick')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_trace(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return  # torn write at the end of the trace
+
+
+@dataclass
+class ReplayReport:
+    schedules: int = 0
+    diverged: int = 0  # solves whose plan differs from the recorded one
+    moved: int = 0  # requests planned at another offset
+    first_divergence: float = None  # time of the first differing solve
+    score_delta: float = 0.0  # summed score of replayed minus recorded plans, lower is better
+    recorded_durations: List[float] = field(default_factory=list)
+    durations: List[float] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        def distribution(durations):
+            if not durations:
+                return {}
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            return {'mean': float(np.mean(durations)), 'p50': float(p50), 'p90': float(p90),
+                    'p99': float(p99), 'max': float(np.max(durations))}
+        return {
+            'schedules': self.schedules,
+            'diverged': self.diverged,
+            'moved': self.moved,
+            'first_divergence': self.first_divergence,
+            'score_delta': self.score_delta,
+            'recorded_duration': distribution(self.recorded_durations),
+            'duration': distribution(self.durations),
+        }
+
+
+def replay(path: str, scheduler: IScheduler, follow_recorded: bool = True) -> ReplayReport:
+    """Feeds a trace into a new Hub as fast as possible.
+
+    With `follow_recorded` the recorded plan is applied after every comparison, so each solve
+    sees the same state as in the agent. Otherwise the Hub goes on with its own plans.
+    """
+    hub = Hub(scheduler, _MutedPubsub())
+    report = ReplayReport()
+
+    for entry in read_trace(path):
+        if entry['event'] == 'source':
+            hub.update_source_profile(entry['source'], np.array(decode_profile(entry['profile'])), autoschedule=False)
+        elif entry['event'] == 'request':
+            request = Request(int(entry['id']), entry['device'], decode_profile(entry['profile']), entry['timeout'])
+            hub.add_request(request, autoschedule=False)
+        elif entry['event'] == 'consumption':
+            hub.report_consumption(int(entry['id']), entry['tick'], np.array(entry['values']), entry['finished'])
+        elif entry['event'] == 'schedule':
+            recorded: Dict[int, int] = {int(request_id): offset for request_id, offset in entry['plan']}
+            hub.schedule()
+            report.schedules += 1
+            report.durations.append(hub.last_schedule_duration)
+            report.recorded_durations.append(entry['duration'])
+
+            moved = sum(hub.plan.get(request_id) != offset for request_id, offset in recorded.items())
+            if moved:
+                report.diverged += 1
+                report.moved += moved
+                if report.first_divergence is None:
+                    report.first_divergence = entry['time']
+                if recorded.keys() == hub.plan.keys():  # the same requests are waiting
+                    plan, score = hub.plan, hub.score
+                    hub.apply_plan(recorded)
+                    report.score_delta += score - hub.score
+                    hub.apply_plan(plan)
+            if follow_recorded:
+                hub.apply_plan({request_id: recorded.get(request_id, offset) for request_id, offset in hub.plan.items()})
+        elif entry['event'] == 'tick':
+            hub.tick()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays a HubAgent trace with a scheduler.")
+    parser.add_argument('trace')
+    parser.add_argument('--scheduler', default='GreedyScheduler')
+    parser.add_argument('--lookahead', type=int, default=6*4)
+    parser.add_argument('--own-plans', action='store_true', help="continue with replayed plans instead of recorded ones")
+    args = parser.parse_args(argv)
+
+    scheduler = getattr(volttron_optimizer, args.scheduler)(args.lookahead)
+    with contextlib.redirect_stdout(sys.stderr):  # Hub prints while scheduling
+        report = replay(args.trace, scheduler, follow_recorded=not args.own_plans)
+    print(json.dumps(report.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
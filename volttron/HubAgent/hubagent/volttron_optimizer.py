@@ -1,9 +1,10 @@
-from itertools import product
+from itertools import product, islice
 from collections import defaultdict
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Tuple, Callable
 import random
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 from pulp import LpMinimize, LpProblem, LpStatus, LpVariable, value
@@ -26,7 +27,49 @@ class Request:
 class Job:
     request_id: int
     device_name: str
-    profile: np.array
+    profile: np.array  # energy still to be consumed, starting with the current tick
+    elapsed: int = 0  # ticks since start
+    nominal: np.array = None  # profile of the request
+    measured: float = 0.0  # energy reported by the device
+    expected: float = 0.0  # nominal energy of the reported ticks
+
+    def __post_init__(self):
+        if self.nominal is None:
+            self.nominal = self.profile
+
+
+def profile_columns(requests: List[Request]) -> Tuple[np.array, np.array]:
+    """Returns all profiles concatenated into one array and their lengths."""
+    lengths = np.array([len(request.profile) for request in requests], dtype=int)
+    values = np.concatenate([request.profile for request in requests]) if requests else np.array([])
+    return values, lengths
+
+
+def scatter_profiles(values: np.array, lengths: np.array, offsets: np.array, ticks: int) -> np.array:
+    """Sums profiles shifted by offsets for every plan (row of offsets) at once.
+
+    Samples falling after `ticks` are dropped. Returns array of shape (plans, ticks).
+    """
+    offsets = np.atleast_2d(offsets)
+    plans = len(offsets)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.repeat(offsets, lengths, axis=1) + np.arange(len(values)) - np.repeat(starts, lengths)
+    indices = positions + ticks * np.arange(plans)[:, np.newaxis]
+    weights = np.broadcast_to(values, indices.shape)
+    mask = positions < ticks
+    energy = np.bincount(indices[mask], weights=weights[mask], minlength=plans*ticks)
+    return energy.reshape(plans, ticks)
+
+
+def score_plans(available_energy: np.array, planned_energy: np.array, offsets: np.array) -> np.array:
+    """Scores every plan, lower is better. Energy arrays must be of the same length."""
+    delta_energy = available_energy - planned_energy
+
+    energy_lost = np.where(delta_energy < 0, delta_energy, 0).sum(axis=-1)
+    energy_to_buy = np.where(delta_energy > 0, delta_energy, 0).sum(axis=-1)
+    average_delay = offsets.sum(axis=-1) / offsets.shape[-1]
+
+    return 1*energy_to_buy + 0.05*energy_lost + 0.1*average_delay
 
 
 class IScheduler(ABC):
@@ -34,13 +77,16 @@ class IScheduler(ABC):
         self.lookahead: int = lookahead
         # TODO: metric parameters
 
+    # prices are optional costs of every unit of energy consumed in a tick, e.g. a feeder signal
     @abstractmethod
-    def schedule(self, available_energy: np.array, requests: List[Request]) -> Dict[int, int]:
+    def schedule(self, available_energy: np.array, requests: List[Request], prices: np.array = None) -> Dict[int, int]:
         pass
 
 
 class BruteForceScheduler(IScheduler):
-    def schedule(self, available_energy: np.array, requests: List[Request]) -> Dict[int, int]:
+    batch_size: int = 4096
+
+    def schedule(self, available_energy: np.array, requests: List[Request], prices: np.array = None) -> Dict[int, int]:
         if not requests:
             return {}
 
@@ -52,24 +98,24 @@ class BruteForceScheduler(IScheduler):
 
         available_energy = utils.pad(available_energy, self.lookahead)
 
-        for offsets in product(*map(range, max_offsets)):
-            planned_energy = np.zeros(self.lookahead)
-
-            for request, offset in zip(requests, offsets):
-                profile = request.profile[:self.lookahead-offset]
-                planned_energy[offset:][:len(profile)] += profile
+        values, lengths = profile_columns(requests)
 
-            delta_energy = available_energy - planned_energy
+        # candidate plans are scored in batches to bound memory usage
+        candidates = product(*map(range, max_offsets))
+        while True:
+            offsets = np.array(list(islice(candidates, self.batch_size)), dtype=int).reshape(-1, len(requests))
+            if not len(offsets):
+                break
 
-            energy_lost = sum(delta_energy[delta_energy < 0])  # TODO: rename
-            energy_to_buy = sum(delta_energy[delta_energy > 0])
-            average_delay = sum(offsets) / len(requests)
+            planned_energy = scatter_profiles(values, lengths, offsets, self.lookahead)
+            scores = score_plans(available_energy, planned_energy, offsets)
+            if prices is not None:
+                scores += planned_energy @ utils.pad(prices, self.lookahead)
 
-            score = 1*energy_to_buy + 0.05*energy_lost + 0.1*average_delay  # TODO: use metric object
-
-            if score < best_score:
-                best_offsets = offsets
-                best_score = score
+            best = np.argmin(scores)
+            if scores[best] < best_score:
+                best_offsets = tuple(map(int, offsets[best]))
+                best_score = scores[best]
 
         #print(best_score)
 
@@ -81,11 +127,11 @@ class BruteForceScheduler(IScheduler):
 
 
 class LinearProgrammingScheduler(IScheduler):
-    def schedule(self, available_energy: np.array, requests: List[Request]) -> Dict[int, int]:
+    def schedule(self, available_energy: np.array, requests: List[Request], prices: np.array = None) -> Dict[int, int]:
         if not requests:
             return {}
 
-        available_energy = utils.pad(available_energy, len(available_energy) - self.lookahead)
+        available_energy = utils.pad(available_energy, self.lookahead)
 
         offset_ranges = {
             r: min(self.lookahead - len(r.profile) + 1, r.timeout + 1) for r in requests
@@ -159,6 +205,10 @@ class LinearProgrammingScheduler(IScheduler):
         cost_f -= 1 * sum(neg_cost_vars)
         for request in requests:
             cost_f += 0.1 * (sum(offset_value_vars[request])) / len(requests)
+        if prices is not None:
+            prices = utils.pad(prices, self.lookahead)
+            for request in requests:
+                cost_f += sum(prices[offset] * var for offset, var in enumerate(req_energy_vars[request]))
 
         model += cost_f
         model.solve()  # CBC solver
@@ -180,37 +230,237 @@ class LinearProgrammingScheduler(IScheduler):
         return plan
 
 
+class GreedyScheduler(IScheduler):
+    """Places requests one by one, the most energy-hungry first, at the offset scoring best together
+    with the requests placed before. The plan is not optimal, but the work grows linearly with
+    the number of requests instead of exponentially. On the families of optimizer/benchmark.py
+    its plans score up to 0.64 worse than the best known ones, 0.18 in the median."""
+
+    def schedule(self, available_energy: np.array, requests: List[Request], prices: np.array = None) -> Dict[int, int]:
+        if not requests:
+            return {}
+
+        available_energy = utils.pad(available_energy, self.lookahead)
+        planned_energy = np.zeros(self.lookahead)
+        placed_offsets = []
+        plan = {}
+
+        for request in sorted(requests, key=lambda request: -np.sum(request.profile)):
+            max_offset = max(min(request.timeout, self.lookahead - len(request.profile)) + 1, 1)
+            candidates = np.arange(max_offset)[:, np.newaxis]
+            shifted = scatter_profiles(np.asarray(request.profile, dtype=float),
+                                       np.array([len(request.profile)]), candidates, self.lookahead)
+            offsets = np.hstack((np.tile(placed_offsets, (max_offset, 1)).astype(int), candidates))
+            scores = score_plans(available_energy, planned_energy + shifted, offsets)
+            if prices is not None:
+                scores += shifted @ utils.pad(prices, self.lookahead)
+
+            best = int(np.argmin(scores))
+            planned_energy += shifted[best]
+            placed_offsets.append(best)
+            plan[request.request_id] = best
+
+        return plan
+
+
+class AdaptiveScheduler(IScheduler):
+    """Delegates every solve to the first of `candidates` expected to finish within `slo` seconds,
+    or to the last one if none is. Candidates should be ordered from the exact to the fastest.
+
+    Expected time is the work of a problem, modelled per scheduler from the offset ranges, the
+    request count and the lookahead, times seconds per unit of work. The latter starts from
+    rough defaults and follows solve times measured on this machine.
+    """
+
+    DEFAULT_RATES = {  # seconds per unit of work
+        'BruteForceScheduler': 2e-8,
+        'LinearProgrammingScheduler': 1e-5,
+        'GreedyScheduler': 1e-6,
+    }
+
+    def __init__(self, lookahead: int, candidates: List[IScheduler], slo: float, smoothing: float = 0.3):
+        super().__init__(lookahead)
+        self.candidates: List[IScheduler] = candidates
+        self.slo: float = slo
+        self.smoothing: float = smoothing
+        self.rates: Dict[str, float] = {
+            type(scheduler).__name__: self.DEFAULT_RATES.get(type(scheduler).__name__, 1e-6)
+            for scheduler in candidates
+        }
+        self.last_choice: str = None
+        self.last_duration: float = 0.0
+
+    def work(self, scheduler: IScheduler, requests: List[Request]) -> float:
+        ranges = [max(min(request.timeout, self.lookahead - len(request.profile)) + 1, 1) for request in requests]
+        if isinstance(scheduler, BruteForceScheduler):
+            return float(np.prod(ranges, dtype=float)) * self.lookahead
+        if isinstance(scheduler, LinearProgrammingScheduler):
+            return float(sum(ranges)) * len(requests) * self.lookahead
+        return float(sum(ranges)) * self.lookahead
+
+    def choose(self, requests: List[Request]) -> IScheduler:
+        for scheduler in self.candidates:
+            if self.rates[type(scheduler).__name__] * self.work(scheduler, requests) <= self.slo:
+                return scheduler
+        return self.candidates[-1]
+
+    def schedule(self, available_energy: np.array, requests: List[Request], prices: np.array = None) -> Dict[int, int]:
+        if not requests:
+            return {}
+
+        scheduler = self.choose(requests)
+        started = time.perf_counter()
+        plan = scheduler.schedule(available_energy, requests, prices=prices)
+        self.observe(type(scheduler).__name__, requests, time.perf_counter() - started)
+        return plan
+
+    def observe(self, name: str, requests: List[Request], duration: float) -> None:
+        """Follows the solve time of a candidate, also of solves run by copies of this scheduler
+        in other processes."""
+        scheduler = next(scheduler for scheduler in self.candidates if type(scheduler).__name__ == name)
+        self.last_duration = duration
+        self.last_choice = name
+        rate = duration / max(self.work(scheduler, requests), 1.0)
+        self.rates[name] += self.smoothing * (rate - self.rates[name])
+
+
 class Hub:
-    def __init__(self, scheduler: IScheduler, pubsub):
+    def __init__(self, scheduler: IScheduler, pubsub, trigger_topic: str = "devices/AGH/D17/Trigger/all",
+                 on_start: Callable[[str, Request], None] = None):
         self.scheduler: IScheduler = scheduler
         self.source_profiles: Dict[str, np.array] = {}
         self.waiting_requests: List[Request] = []
         self.running_jobs = []
         self.plan: Dict[int, int] = {}
         self.pubsub = pubsub
+        self.trigger_topic = trigger_topic
+        # when set, starts are delivered to every device on its own topic instead of trigger_topic
+        self.on_start: Callable[[str, Request], None] = on_start
+        self._cache: Dict[str, np.array] = {}  # memoized energy curves, see _invalidate
+        self.version: int = 0  # changes with every mutation
+        self.schedules: int = 0
+        self.last_schedule_duration: float = 0.0
+        # ids of requests started and of jobs finished since the last take_events
+        self.started: List[int] = []
+        self.finished: List[int] = []
 
     def update_source_profile(self, source_name: str, profile: np.array, autoschedule: bool = True):
         self.source_profiles[source_name] = profile
+        self._invalidate('source')
+        if autoschedule:
+            self.schedule()
+
+    def patch_source_profile(self, source_name: str, shift: int, indices: np.array, values: np.array,
+                             tail: np.array, autoschedule: bool = True):
+        """Drops `shift` leading samples of a source profile, appends `tail` and overwrites samples
+        at `indices` in place. The profile must be writable. A negative `shift` tells that the profile
+        already starts that many samples after the one `indices` count from, so `indices` are moved
+        back by it and those falling before the head are dropped."""
+        if shift < 0:
+            indices = indices + shift
+            values = values[indices >= 0]
+            indices = indices[indices >= 0]
+            shift = 0
+        profile = self.source_profiles[source_name][shift:]
+        if len(tail):
+            profile = np.concatenate((profile, tail))
+        profile[indices] = values
+        self.source_profiles[source_name] = profile
+        self._invalidate('source')
         if autoschedule:
             self.schedule()
 
     def add_request(self, request: Request, autoschedule: bool = True):
         self.waiting_requests.append(request)
         self.plan[request.request_id] = 0
+        self._invalidate('plan')
+        if autoschedule:
+            self.schedule()
+
+    def add_requests(self, requests: List[Request], autoschedule: bool = True) -> None:
+        for request in requests:
+            self.add_request(request, autoschedule=False)
         if autoschedule:
             self.schedule()
 
     def schedule(self):
         print("PRESCHEDULE")
+        started = time.perf_counter()
         try:
             self.plan = self.scheduler.schedule(self.available_energy, self.waiting_requests)
         except Exception as e:
             print("EXCEPTION", e)
-            
+        self.schedules += 1
+        self.last_schedule_duration = time.perf_counter() - started
+        self._invalidate('plan')
+
         print("POSTSCHEDULE")
 
+    def apply_plan(self, plan: Dict[int, int]) -> None:
+        self.plan = plan
+        self._invalidate('plan')
+
+    def load_state(self, source_profiles: Dict[str, np.array], waiting_requests: List[Request],
+                   running_jobs: List[Job], plan: Dict[int, int]) -> None:
+        self.source_profiles = source_profiles
+        self.waiting_requests = waiting_requests
+        self.running_jobs = running_jobs
+        self.plan = plan
+        self._invalidate('source', 'jobs', 'plan')
+
+    # energy curves are recomputed lazily and only after one of the mutations above
+    _DEPENDENCIES = {
+        'source': ('source_energy', 'available_energy', 'score'),
+        'jobs': ('assigned_energy', 'available_energy', 'score'),
+        'plan': ('request_columns', 'planned_energy', 'score'),
+    }
+
+    def _invalidate(self, *changes: str) -> None:
+        self.version += 1
+        for change in changes:
+            for name in self._DEPENDENCIES[change]:
+                self._cache.pop(name, None)
+
+    def _cached(self, name: str, compute: Callable[[], np.array]) -> np.array:
+        if name not in self._cache:
+            value = compute()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False  # shared between callers
+            self._cache[name] = value
+        return self._cache[name]
+
     @property
     def source_energy(self) -> np.array:
+        return self._cached('source_energy', self._source_energy)
+
+    @property
+    def assigned_energy(self) -> np.array:
+        return self._cached('assigned_energy', self._assigned_energy)
+
+    @property
+    def available_energy(self) -> np.array:
+        return self._cached('available_energy', self._available_energy)
+
+    @property
+    def planned_energy(self) -> np.array:
+        return self._cached('planned_energy', self._planned_energy)
+
+    @property
+    def score(self) -> float:
+        return self._cached('score', self._score)
+
+    def current_tick_summary(self) -> Tuple[float, float, float]:
+        """Returns available, assigned and planned energy of the current tick."""
+        source_energy = sum(profile[0] for profile in self.source_profiles.values() if len(profile))
+        assigned_energy = sum(job.profile[0] for job in self.running_jobs if len(job.profile))
+        planned_energy = sum(
+            request.profile[0]
+            for request in self.waiting_requests
+            if self.plan[request.request_id] == 0 and len(request.profile)
+        )
+        return float(source_energy - assigned_energy), float(assigned_energy), float(planned_energy)
+
+    def _source_energy(self) -> np.array:
         profiles = self.source_profiles.values()
         if not profiles:
             return np.array([])
@@ -220,8 +470,7 @@ class Hub:
             energy[:len(profile)] += profile
         return energy
 
-    @property
-    def assigned_energy(self) -> np.array:
+    def _assigned_energy(self) -> np.array:
         profiles = [job.profile for job in self.running_jobs]
         if not profiles:
             return np.array([])
@@ -231,8 +480,7 @@ class Hub:
             energy[:len(profile)] += profile
         return energy
 
-    @property
-    def available_energy(self) -> np.array:
+    def _available_energy(self) -> np.array:
         source_energy = self.source_energy
         assigned_energy = self.assigned_energy
         ticks = max(len(source_energy), len(assigned_energy))
@@ -241,32 +489,28 @@ class Hub:
         energy[:len(assigned_energy)] -= assigned_energy
         return energy
 
-    @property
-    def planned_energy(self) -> np.array:
+    def _planned_energy(self) -> np.array:
         if not self.waiting_requests:
             return np.array([])
-        ticks = max(
-            self.plan[request.request_id] + len(request.profile)
-            for request in self.waiting_requests
-        )
-        energy = np.zeros(ticks)
-        for request in self.waiting_requests:
-            offset = self.plan[request.request_id]
-            energy[offset:][:len(request.profile)] += request.profile
-        return energy
-
-    @property
-    def score(self) -> float:
-        delta_energy = self.available_energy - self.planned_energy
-
-        energy_lost = sum(delta_energy[delta_energy < 0])
-        energy_to_buy = sum(delta_energy[delta_energy > 0])
-        average_delay = sum(self.plan.values()) / len(self.waiting_requests)
-
-        score = 1*energy_to_buy + 0.05*energy_lost + 0.1*average_delay
-        return score
+        values, lengths = self._cached('request_columns', lambda: profile_columns(self.waiting_requests))
+        offsets = self._plan_offsets()
+        ticks = int(max(offsets + lengths))
+        return scatter_profiles(values, lengths, offsets, ticks)[0]
+
+    def _plan_offsets(self) -> np.array:
+        return np.array([self.plan[request.request_id] for request in self.waiting_requests], dtype=int)
+
+    def _score(self) -> float:
+        available_energy = self.available_energy
+        planned_energy = self.planned_energy
+        ticks = max(len(available_energy), len(planned_energy))
+        available_energy = utils.pad(available_energy, ticks)
+        planned_energy = utils.pad(planned_energy, ticks)
+        return float(score_plans(available_energy, planned_energy, self._plan_offsets()))
 
     def tick(self):
+        self._invalidate('source', 'jobs', 'plan')
+
         for source_name, profile in self.source_profiles.items():
             self.source_profiles[source_name] = self.source_profiles[source_name][1:]
 
@@ -279,24 +523,65 @@ class Hub:
 
         for job in self.running_jobs.copy():
             job.profile = job.profile[1:]  # this must be executed after request handling
+            job.elapsed += 1
             if not len(job.profile):
                 # job has ended
                 self.running_jobs.remove(job)
+                self.finished.append(job.request_id)
+        # again, as on_start may have read curves while the tick was half done
+        self._invalidate('source', 'jobs', 'plan')
 
-        self.pubsub.publish('pubsub', "devices/AGH/D17/Trigger/all", message=
+        if self.on_start:
+            return
+        self.pubsub.publish('pubsub', self.trigger_topic, message=
                         [{'trigger': 0, 'device': 'none' },{'trigger':{'type':'integer','tz':'US/Pacific','units':'Trigger'},'device':{'type':'string','tz':'US/Pacific','units':'device_name'}}])
 
+    def report_consumption(self, request_id: int, tick: int, values: np.array, finished: bool = False) -> bool:
+        """Takes energy measured by a device at ticks `tick`, `tick+1`, ... since the start of a job.
+
+        The rest of the job's profile is scaled by the ratio of all energy measured so far to its
+        nominal energy, so that `assigned_energy` follows the measured load. A finished job is removed.
+        Returns False for jobs that are not running.
+        """
+        job = next((job for job in self.running_jobs if job.request_id == request_id), None)
+        if job is None:
+            return False
+        values = np.asarray(values, dtype=float)
+        job.measured += float(values.sum())
+        job.expected += float(job.nominal[tick:tick+len(values)].sum())
+        if finished:
+            self.running_jobs.remove(job)
+            self.finished.append(job.request_id)
+        elif job.expected > 0:
+            job.profile = job.nominal[job.elapsed:] * (job.measured / job.expected)
+        self._invalidate('jobs')
+        return True
+
     #private
     def start_request(self, request: Request):
         self.waiting_requests.remove(request)
         del self.plan[request.request_id]
         job = Job(request.request_id, request.device_name, request.profile)
         self.running_jobs.append(job)
-        self.pubsub.publish('pubsub', "devices/AGH/D17/Trigger/all", message=
+        self.started.append(request.request_id)
+        if self.on_start:
+            self.on_start(self.device_trigger_topic(request.device_name), request)
+            return
+        self.pubsub.publish('pubsub', self.trigger_topic, message=
                         [{'trigger': 1, 'device': request.device_name },{'trigger':{'type':'integer','tz':'US/Pacific','units':'Trigger'},'device':{'type':'string','tz':'US/Pacific','units':'device_name'}}])
-        self.pubsub.publish('pubsub', "devices/AGH/D17/Trigger/all", message=
+        self.pubsub.publish('pubsub', self.trigger_topic, message=
                         [{'trigger': 0, 'device': request.device_name },{'trigger':{'type':'integer','tz':'US/Pacific','units':'Trigger'},'device':{'type':'string','tz':'US/Pacific','units':'device_name'}}])
 
+    def take_events(self) -> Tuple[List[int], List[int]]:
+        """Returns ids of requests started and of jobs finished since the last call."""
+        events = (self.started, self.finished)
+        self.started, self.finished = [], []
+        return events
+
+    def device_trigger_topic(self, device_name: str) -> str:
+        """Returns trigger topic of a single device, e.g. 'devices/AGH/D17/Trigger/WashingMachine1'."""
+        return self.trigger_topic.rsplit('/', 1)[0] + '/' + device_name
+
     #debug
     def summary(self):
         print('Source profiles:')
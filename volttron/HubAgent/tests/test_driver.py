@@ -0,0 +1,51 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from hubagent.driver import TickDriver
+from hubagent.ingestion import SourceSync
+from hubagent.reporting import ResultFilter
+
+
+def make_driver(period=1.0):
+    core = SimpleNamespace(schedule=lambda deadline, callback: SimpleNamespace(cancel=lambda: None))
+    driver = TickDriver(core, period, lambda: None, threading.RLock())
+    driver.start()
+    return driver
+
+
+def test_period_change_rebases_deadline():
+    driver = make_driver(60.0)
+    for _ in range(3):
+        driver._run()
+    driver.period = 1.0
+    assert driver.ticks == 3
+    assert abs(driver.next_deadline - (time.time() + 1.0)) < 0.5
+
+
+def test_period_change_keeps_hub_tick():
+    driver = make_driver()
+    sync = SourceSync()
+    results = ResultFilter(deadband=0.1, heartbeat=4)
+    values = {'available_energy': 1.0}
+
+    for _ in range(5):
+        driver._run()
+    sync.base('panel', 0, 105, driver.ticks)
+    assert results.update('hub', values, {1: 6}, [], [], driver.ticks) is not None
+
+    driver.period = 2.0  # reconfigured mid-run
+    for _ in range(2):
+        driver._run()
+
+    # the source ticked along with the Hub, whose profile is already shifted
+    assert sync.shift('panel', 1, 107, driver.ticks) == 0
+    # the plan only aged, so nothing moved and the heartbeat is not due yet
+    assert results.update('hub', values, {1: 4}, [], [], driver.ticks) is None
+    for _ in range(2):
+        driver._run()
+    diff = results.update('hub', values, {1: 2}, [], [], driver.ticks)
+    assert diff is not None and not diff['moved']
+    assert driver.metrics()['tick'] == 9
@@ -0,0 +1,59 @@
+import numpy as np
+
+from hubagent.ingestion import SourceSync
+from hubagent.persistence import _MutedPubsub
+from hubagent.volttron_optimizer import GreedyScheduler, Hub
+from hubagent.wire import profile_delta
+
+
+def make_hub(profile):
+    hub = Hub(GreedyScheduler(24), _MutedPubsub())
+    hub.update_source_profile('panel', np.array(profile), autoschedule=False)
+    return hub
+
+
+def publish(sync, hub, previous, profile, seq, tick, hub_tick):
+    """Applies a delta turning `previous`, shifted by the source's ticks as SolarAgent does,
+    into `profile` the way HubAgent does and returns the shift."""
+    indices, values, tail, _ = profile_delta(previous, profile)
+    shift = sync.shift('panel', seq, tick, hub_tick)
+    if shift is not None:
+        hub.patch_source_profile('panel', shift, indices, values, tail, autoschedule=False)
+    return shift
+
+
+def test_two_hub_ticks_per_publish():
+    day = np.linspace(0, 1, 200)
+    sync = SourceSync()
+    hub = make_hub(day[:96])
+    sync.base('panel', 0, 0, 0)
+
+    previous = day[:96]
+    for seq in range(1, 6):
+        hub.tick()
+        hub.tick()
+        # the source moved by one tick only, with a changed sample before and after the Hub's head
+        profile = np.array(day[seq:seq+96])
+        profile[0] += 0.5
+        profile[10] += 0.5
+        shift = publish(sync, hub, previous[1:], profile, seq, seq, 2*seq)
+        assert shift is not None and shift <= 0
+        assert np.allclose(hub.source_profiles['panel'], profile[seq:])
+        previous = profile
+
+
+def test_gap_in_sequence_resyncs():
+    sync = SourceSync()
+    sync.base('panel', 0, 0, 0)
+    assert sync.shift('panel', 2, 1, 1) is None
+    assert sync.shift('panel', 3, 2, 2) is None  # until a base profile comes
+
+
+def test_source_ahead_drops_samples():
+    day = np.linspace(0, 1, 200)
+    sync = SourceSync()
+    hub = make_hub(day[:96])
+    sync.base('panel', 0, 0, 0)
+    hub.tick()
+    assert publish(sync, hub, day[2:96], day[2:98], 1, 2, 1) == 1
+    assert np.allclose(hub.source_profiles['panel'], day[2:98])
@@ -0,0 +1,46 @@
+import numpy as np
+
+from hubagent.persistence import _MutedPubsub
+from hubagent.reporting import ResultFilter
+from hubagent.volttron_optimizer import GreedyScheduler, Hub, Request
+
+
+def publish(results, hub, tick):
+    return results.update('hub', {'available_energy': 0.0}, hub.plan, *hub.take_events(), tick)
+
+
+def test_job_of_one_tick_is_started_and_finished():
+    hub = Hub(GreedyScheduler(24), _MutedPubsub())
+    results = ResultFilter(deadband=0.1, heartbeat=4)
+    hub.add_request(Request(1, 'kettle', np.array([0.5]), 0), autoschedule=False)
+    assert publish(results, hub, 0)['added'] == {'1': 0}
+
+    hub.tick()
+    assert not hub.running_jobs  # started and finished within the tick
+    diff = publish(results, hub, 1)
+    assert diff['started'] == ['1'] and diff['finished'] == ['1'] and diff['removed'] == []
+
+
+def test_request_leaving_the_plan_is_removed():
+    hub = Hub(GreedyScheduler(24), _MutedPubsub())
+    results = ResultFilter(deadband=0.1, heartbeat=4)
+    hub.add_request(Request(1, 'washer', np.array([0.5, 0.5]), 8), autoschedule=False)
+    hub.apply_plan({1: 4})
+    publish(results, hub, 0)
+
+    hub.load_state({}, [], [], {})
+    diff = publish(results, hub, 1)
+    assert diff['removed'] == ['1'] and diff['started'] == []
+
+
+def test_events_are_reported_once():
+    hub = Hub(GreedyScheduler(24), _MutedPubsub())
+    results = ResultFilter(deadband=0.1, heartbeat=4)
+    hub.add_request(Request(1, 'washer', np.array([0.5, 0.5]), 0), autoschedule=False)
+    publish(results, hub, 0)
+    hub.tick()
+    assert publish(results, hub, 1)['started'] == ['1']
+    hub.report_consumption(1, 0, np.array([0.5, 0.5]), finished=True)
+    diff = publish(results, hub, 2)
+    assert diff['started'] == [] and diff['finished'] == ['1']
+    assert publish(results, hub, 3) is None
@@ -1,14 +1,20 @@
 """
-Agent documentation goes here.
+Receiver agent: starts devices on permits of the Hub, runs their profiles tick by tick
+and reports the energy they actually draw.
 """
 
 __docformat__ = 'reStructuredText'
 
 import logging
 import sys
+
+import numpy as np
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent, Core, RPC
 
+from .devices import ConsumptionBatcher, DeviceMachine
+from .wire import decode_profile
+
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
@@ -34,9 +40,21 @@ def dummyreceiver(config_path, **kwargs):
 
     setting1 = int(config.get('setting1', 1))
     setting2 = config.get('setting2', "some/random/topic")
+    site = config.get('site', "AGH/D17")
+    devices = config.get('devices', [])
+    tick_period = float(config.get('tick_period', 1.0))
+    report_ticks = int(config.get('report_ticks', 4))
+    noise = float(config.get('noise', 0.1))
+    seed = config.get('seed')
 
     return Dummyreceiver(setting1,
                           setting2,
+                          site,
+                          devices,
+                          tick_period,
+                          report_ticks,
+                          noise,
+                          seed,
                           **kwargs)
 
 
@@ -46,15 +64,28 @@ class Dummyreceiver(Agent):
     """
 
     def __init__(self, setting1=1, setting2="some/random/topic",
+                 site="AGH/D17", devices=(), tick_period=1.0, report_ticks=4, noise=0.1, seed=None,
                  **kwargs):
         super(Dummyreceiver, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
         self.setting1 = setting1
         self.setting2 = setting2
+        self.site = site
+        # devices of the site handled by this receiver, all of them when empty
+        self.device_names = set(devices)
+        self.devices = {}
+        self.tick_period = tick_period
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        # consumption is reported every report_ticks ticks to keep bus load low
+        self.batcher = ConsumptionBatcher(report_ticks)
+        self.runner = None
 
         self.default_config = {"setting1": setting1,
-                               "setting2": setting2}
+                               "setting2": setting2,
+                               "report_ticks": report_ticks,
+                               "noise": noise}
 
 
         #Set a default configuration to ensure that self.configure is called immediately to setup
@@ -78,15 +109,18 @@ class Dummyreceiver(Agent):
         try:
             setting1 = int(config["setting1"])
             setting2 = str(config["setting2"])
+            report_ticks = int(config["report_ticks"])
+            noise = float(config["noise"])
         except ValueError as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
         self.setting1 = setting1
         self.setting2 = setting2
+        self.batcher.ticks = report_ticks
+        self.noise = noise
 
-        topic='devices/AGH/D17/Panel/all'
-        self._create_subscriptions(topic)
+        self._create_subscriptions(self.setting2)
 
     def _create_subscriptions(self, topic):
         #Unsubscribe from everything.
@@ -96,6 +130,70 @@ class Dummyreceiver(Agent):
                                   prefix=topic,
                                   callback=self._handle_publish)
 
+        self.vip.pubsub.subscribe(peer='pubsub',
+                                  prefix="devices/{}/Device/request".format(self.site),
+                                  callback=self.on_request)
+
+        self.vip.pubsub.subscribe(peer='pubsub',
+                                  prefix="devices/{}/Device/response".format(self.site),
+                                  callback=self.on_response)
+
+        self.vip.pubsub.subscribe(peer='pubsub',
+                                  prefix="devices/{}/Trigger/".format(self.site),
+                                  callback=self.on_trigger)
+
+    def device(self, name):
+        """Returns state machine of a device handled by this receiver, None for other devices."""
+        if self.device_names and name not in self.device_names:
+            return None
+        if name not in self.devices:
+            self.devices[name] = DeviceMachine(name)
+        return self.devices[name]
+
+    def on_request(self, peer, sender, bus, topic, headers,
+                            message):
+        # a single request or a list of them, as accepted by the Hub
+        items = message[0] if isinstance(message[0], list) else [message[0]]
+        for item in items:
+            device = self.device(item['device'])
+            if device and not device.announce(str(item['id']), decode_profile(item['profile']), int(item['timeout'])):
+                _log.warning("Request {} of {} has an empty profile".format(item['id'], item['device']))
+
+    def on_response(self, peer, sender, bus, topic, headers,
+                            message):
+        # requests the Hub turned away will never get a permit
+        response = message[0]
+        if response.get('status') not in ('rejected', 'deferred'):
+            return
+        device = self.device(response['device'])
+        if device:
+            device.withdraw(str(response['id']))
+
+    def on_trigger(self, peer, sender, bus, topic, headers,
+                            message):
+        name = topic.rsplit('/', 1)[1]
+        permit = message[0]
+        if permit.get('trigger') != 1 or 'id' not in permit or permit.get('device') != name:
+            return  # acknowledgements and shared triggers
+        device = self.device(name)
+        if device is None:
+            return
+        if not device.permit(permit['id']):
+            _log.warning("Start permit of unknown request {} for {}".format(permit['id'], name))
+        # permits are resent until acknowledged, so a repeated one is acknowledged again
+        self.vip.pubsub.publish('pubsub', "devices/{}/Trigger/ack".format(self.site), message=
+            [{'id': permit['id'], 'device': name}])
+
+    def run_devices(self):
+        for device in self.devices.values():
+            record = device.step(self.rng, self.noise)
+            if record:
+                self.batcher.add(record)
+        records = self.batcher.step()
+        if records:
+            self.vip.pubsub.publish('pubsub', "devices/{}/Receiver/consumption".format(self.site), message=
+                [records, {'consumption':{'type':'object','tz':'US/Pacific','units':'kWh'}}])
+
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
         """
@@ -112,11 +210,11 @@ class Dummyreceiver(Agent):
 
         #Exmaple RPC call
         #self.vip.rpc.call("some_agent", "some_method", arg1, arg2)
+        self.runner = self.core.periodic(self.tick_period, self.run_devices)
 
     def _handle_publish(self, peer, sender, bus, topic, headers,
                             message):
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Receiver/all", message=
-                        [{'onOff': int(message[0]["moc"]>0.7) },{'onOff':{'type':'integer','tz':'US/Pacific','units':'Watt'}}])
+        pass
 
     @Core.receiver("onstop")
     def onstop(self, sender, **kwargs):
@@ -124,7 +222,8 @@ class Dummyreceiver(Agent):
         This method is called when the Agent is about to shutdown, but before it disconnects from
         the message bus.
         """
-        pass
+        if self.runner:
+            self.runner.kill()
 
     @RPC.export
     def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
@@ -0,0 +1,108 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+
+
+class DeviceMachine:
+    """Runs the requests of one device, one at a time.
+
+    A device is `idle`, `waiting` for the start permit of an announced request, or `running`
+    one. Permits arriving while another request runs are queued. Energy actually drawn differs
+    from the request's profile by a factor drawn for every run and noise of every tick.
+    An announced request is forgotten `grace` ticks after its timeout, when the Hub must have
+    started it already if it ever will.
+    """
+
+    IDLE, WAITING, RUNNING = 'idle', 'waiting', 'running'
+
+    def __init__(self, name: str, grace: int = 2):
+        self.name: str = name
+        self.grace: int = grace
+        self.announced: Dict[str, np.array] = {}  # request id -> profile, not started yet
+        self.expiry: Dict[str, int] = {}  # request id -> clock at which it is forgotten
+        self.clock: int = 0  # ticks stepped
+        self.queued: Deque[str] = deque()  # permitted while running
+        self.job: Optional[str] = None
+        self.profile: np.array = None
+        self.tick: int = 0  # of the running job
+        self.factor: float = 1.0
+
+    @property
+    def state(self) -> str:
+        if self.job is not None:
+            return self.RUNNING
+        return self.WAITING if self.announced else self.IDLE
+
+    def announce(self, request_id: str, profile: np.array, timeout: int) -> bool:
+        """Returns False for an empty profile, which cannot be run."""
+        if not len(profile):
+            return False
+        self.announced[request_id] = profile
+        self.expiry[request_id] = self.clock + timeout + self.grace
+        return True
+
+    def withdraw(self, request_id: str) -> None:
+        """Forgets an announced request that will not be started."""
+        self.announced.pop(request_id, None)
+        self.expiry.pop(request_id, None)
+
+    def permit(self, request_id: str) -> bool:
+        """Starts an announced request with the next tick, or after the running one.
+        Permits sent again are ignored. Returns False for requests never announced."""
+        if request_id == self.job or request_id in self.queued:
+            return True
+        if request_id not in self.announced:
+            return False
+        self.queued.append(request_id)
+        return True
+
+    def step(self, rng: np.random.Generator, noise: float) -> Optional[dict]:
+        """Advances by one tick and returns the energy drawn by the running job."""
+        self.clock += 1
+        for request_id in [request_id for request_id, expiry in self.expiry.items() if expiry < self.clock]:
+            if request_id not in self.queued:
+                self.withdraw(request_id)
+
+        if self.job is None:
+            if not self.queued:
+                return None
+            self.job = self.queued.popleft()
+            self.profile = self.announced.pop(self.job)
+            del self.expiry[self.job]
+            self.tick = 0
+            self.factor = max(rng.normal(1.0, noise), 0.0)
+
+        value = max(float(self.profile[self.tick]) * self.factor * rng.normal(1.0, noise / 2), 0.0)
+        record = {'id': self.job, 'device': self.name, 'tick': self.tick, 'value': value,
+                  'finished': self.tick + 1 == len(self.profile)}
+        self.tick += 1
+        if record['finished']:
+            self.job = None
+        return record
+
+
+class ConsumptionBatcher:
+    """Collects energy drawn by jobs and hands it over every `ticks` ticks, one record per job:
+    the tick of its first value since the start, the values and whether the job has finished."""
+
+    def __init__(self, ticks: int):
+        self.ticks: int = ticks
+        self.records: Dict[str, dict] = {}
+        self.count: int = 0
+
+    def add(self, record: dict) -> None:
+        batched = self.records.get(record['id'])
+        if batched is None:
+            batched = self.records[record['id']] = {
+                'id': record['id'], 'device': record['device'], 'tick': record['tick'], 'values': []}
+        batched['values'].append(record['value'])
+        batched['finished'] = record['finished']
+
+    def step(self) -> List[dict]:
+        """Ends a tick, returns the batch when one is due."""
+        self.count += 1
+        if self.count % self.ticks:
+            return []
+        records, self.records = list(self.records.values()), {}
+        return records
@@ -0,0 +1,74 @@
+"""
+Encoding of energy profiles carried on pubsub topics.
+
+A profile is sent either as a plain JSON list of floats or as a dictionary
+with a header and base64 encoded little-endian samples::
+
+    {'encoding': 'base64', 'dtype': 'float32', 'length': 96, 'tick': 15,
+     'delta': False, 'zlib': False, 'data': '...'}
+
+Delta encoding stores differences of the samples' bit patterns, so it is
+lossless and makes smooth profiles compress better with zlib.
+
+A source may also publish a base profile once and then only the samples that
+changed since, see `profile_delta`.
+"""
+
+import base64
+import zlib
+
+import numpy as np
+
+DTYPES = {
+    'float16': ('<f2', '<i2'),
+    'float32': ('<f4', '<i4'),
+    'float64': ('<f8', '<i8'),
+}
+
+
+def encode_profile(profile, dtype: str = 'float32', delta: bool = False, compress: bool = False,
+                   tick: int = 15) -> dict:
+    float_type, int_type = DTYPES[dtype]
+    values = np.asarray(profile, dtype=float_type)
+    if delta:
+        bits = values.view(int_type)
+        values = np.diff(bits, prepend=np.zeros(1, dtype=int_type)).astype(int_type)
+    data = values.tobytes()
+    if compress:
+        data = zlib.compress(data)
+    return {
+        'encoding': 'base64',
+        'dtype': dtype,
+        'length': len(values),
+        'tick': tick,
+        'delta': delta,
+        'zlib': compress,
+        'data': base64.b64encode(data).decode('ascii'),
+    }
+
+
+def decode_profile(payload) -> np.array:
+    """Returns profile of a payload. Plain samples are not copied, so the array is read-only."""
+    if not isinstance(payload, dict):
+        return np.array(payload, dtype=float)  # JSON list
+
+    float_type, int_type = DTYPES[payload['dtype']]
+    data = base64.b64decode(payload['data'])
+    if payload.get('zlib'):
+        data = zlib.decompress(data)
+    if payload.get('delta'):
+        bits = np.cumsum(np.frombuffer(data, dtype=int_type, count=payload['length']), dtype=int_type)
+        return bits.view(float_type)
+    return np.frombuffer(data, dtype=float_type, count=payload['length'])
+
+
+def profile_delta(previous: np.array, profile, tolerance: float = 0.0):
+    """Returns changes turning `previous` into `profile`: indices and values of samples differing
+    by more than `tolerance`, samples appended at the end, and the profile a receiver applying
+    those changes ends up with. `profile` must not be shorter than `previous`."""
+    profile = np.asarray(profile, dtype=float)
+    head, tail = profile[:len(previous)], profile[len(previous):]
+    indices = np.flatnonzero(np.abs(head - previous) > tolerance)
+    result = np.concatenate((previous, tail))
+    result[indices] = head[indices]
+    return indices, head[indices], tail, result
@@ -17,6 +17,15 @@ import os
 
 import numpy as np
 
+from .wire import encode_profile, profile_delta
+from .weather import WeatherFetcher
+from .simulation import SolarSimulator
+from .forecast import fetch_forecast, fetch_forecast_at_id, cloud_factors
+from .pvmodel import Panel, pv_profile
+from .fleet import SolarFleet
+from datetime import date
+from functools import partial
+
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
@@ -42,9 +51,37 @@ def solaragent(config_path, **kwargs):
 
     setting1 = int(config.get('setting1', 1))
     setting2 = config.get('setting2', "some/random/topic")
+    profile_encodings = config.get('profile_encodings', {})
+    delta_updates = bool(config.get('delta_updates', False))
+    base_interval = int(config.get('base_interval', 96))
+    delta_tolerance = float(config.get('delta_tolerance', 0.01))
+    publish_period = float(config.get('publish_period', 1.0))
+    weather_ttl = float(config.get('weather_ttl', 600.0))
+    weather_source = config.get('weather_source', "forecast")
+    latitude = float(config.get('latitude', 50.06))
+    longitude = float(config.get('longitude', 19.94))
+    forecast_ttl = float(config.get('forecast_ttl', 3600.0))
+    pv_panel = config.get('pv_panel')
+    utc_offset = float(config.get('utc_offset', 1.0))
+    panels = config.get('panels', [])
+    publish_mode = config.get('publish_mode', "panel")
 
     return Solaragent(setting1,
                           setting2,
+                          profile_encodings,
+                          delta_updates,
+                          base_interval,
+                          delta_tolerance,
+                          publish_period,
+                          weather_ttl,
+                          weather_source,
+                          latitude,
+                          longitude,
+                          forecast_ttl,
+                          pv_panel,
+                          utc_offset,
+                          panels,
+                          publish_mode,
                           **kwargs)
 
 
@@ -54,15 +91,35 @@ class Solaragent(Agent):
     """
 
     def __init__(self, setting1=1, setting2="some/random/topic",
+                 profile_encodings=None, delta_updates=False,
+                 base_interval=96, delta_tolerance=0.01,
+                 publish_period=1.0, weather_ttl=600.0,
+                 weather_source="forecast", latitude=50.06, longitude=19.94, forecast_ttl=3600.0,
+                 pv_panel=None, utc_offset=1.0, panels=None, publish_mode="panel",
                  **kwargs):
         super(Solaragent, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
         self.setting1 = setting1
         self.setting2 = setting2
+        # topic -> arguments of encode_profile, profiles on other topics are sent as JSON lists
+        self.profile_encodings = profile_encodings or {}
+        # after a base profile only changed samples are sent, until HubAgent asks for a resync
+        self.delta_updates = delta_updates
+        self.base_interval = base_interval
+        self.delta_tolerance = delta_tolerance
+        self.seq = {}  # (topic, device) -> sequence number of the last update
+        self.tick = 0
+        self.sent = {}  # (topic, device) -> profile HubAgent holds after the last update and its tick
 
         self.default_config = {"setting1": setting1,
-                               "setting2": setting2}
+                               "setting2": setting2,
+                               "profile_encodings": self.profile_encodings,
+                               "delta_updates": delta_updates,
+                               "base_interval": base_interval,
+                               "delta_tolerance": delta_tolerance,
+                               "publish_period": publish_period,
+                               "weather_ttl": weather_ttl}
 
 
         #Set a default configuration to ensure that self.configure is called immediately to setup
@@ -71,11 +128,35 @@ class Solaragent(Agent):
         #Hook self.configure up to changes to the configuration file "config".
         self.vip.config.subscribe(self.configure, actions=["NEW", "UPDATE"], pattern="config")
 
-        self.set_weather_factor()
-
-    def set_weather_factor(self):
-        owm = pyowm.OWM(os.environ["pyowm_api_key"])
-        observation = owm.weather_at_place('Krakow,PL')
+        self.publish_period = publish_period
+        self.publisher = None
+        # weather is fetched in the background, publishing uses the latest factor
+        self.owm = pyowm.OWM(os.environ["pyowm_api_key"])
+        self.weather_factor = 1.0
+        # either a single factor of the current weather or cloud cover forecasts mapped onto ticks
+        self.latitude = latitude
+        self.longitude = longitude
+        if weather_source == "forecast":
+            self.weather = WeatherFetcher(self.fetch_forecast, forecast_ttl, None)
+        else:
+            self.weather = WeatherFetcher(self.fetch_weather_factor, weather_ttl, 1.0)
+        self.weather_source = weather_source
+        self.simulator = SolarSimulator()
+        # without a panel the clear-sky curve is a sine, otherwise it comes from the PV model
+        self.pv_panel = Panel(**pv_panel) if pv_panel else None
+        self.utc_offset = utc_offset
+
+        # many panels of many sites at once, with one weather lookup per distinct location
+        self.fleet = None
+        if panels:
+            registry = self.owm.city_id_registry() if any('city' in panel for panel in panels) else None
+            self.fleet = SolarFleet(panels, registry, utc_offset)
+            self.fleet_weather = [WeatherFetcher(partial(self.fetch_forecast_at, location), forecast_ttl, None)
+                                  for location in self.fleet.locations]
+        self.publish_mode = publish_mode  # "panel" publishes every panel, "hub" their sum per site
+
+    def fetch_weather_factor(self):
+        observation = self.owm.weather_at_place('Krakow,PL')
         w = observation.get_weather()
         status = w.get_detailed_status()
         status2factor = {
@@ -85,7 +166,15 @@ class Solaragent(Agent):
                 'broken clouds': 0.3
             }
 
-        self.weather_factor = status2factor.get(status,1.0)
+        return status2factor.get(status,1.0)
+
+    def fetch_forecast(self):
+        return fetch_forecast(self.owm, self.latitude, self.longitude)
+
+    def fetch_forecast_at(self, location):
+        if location[0] == 'city':
+            return fetch_forecast_at_id(self.owm, location[1])
+        return fetch_forecast(self.owm, location[1], location[2])
 
     def configure(self, config_name, action, contents):
         """
@@ -102,12 +191,28 @@ class Solaragent(Agent):
         try:
             setting1 = int(config["setting1"])
             setting2 = str(config["setting2"])
+            profile_encodings = dict(config["profile_encodings"])
+            delta_updates = bool(config["delta_updates"])
+            base_interval = int(config["base_interval"])
+            delta_tolerance = float(config["delta_tolerance"])
+            publish_period = float(config["publish_period"])
+            weather_ttl = float(config["weather_ttl"])
         except ValueError as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
         self.setting1 = setting1
         self.setting2 = setting2
+        self.profile_encodings = profile_encodings
+        self.delta_updates = delta_updates
+        self.base_interval = base_interval
+        self.delta_tolerance = delta_tolerance
+        if self.weather_source != "forecast":
+            self.weather.ttl = weather_ttl
+        if self.publisher and publish_period != self.publish_period:
+            self.publisher.kill()
+            self.publisher = self.core.periodic(publish_period, self.publish_profile)
+        self.publish_period = publish_period
 
         self._create_subscriptions(self.setting2)
 
@@ -119,18 +224,60 @@ class Solaragent(Agent):
                                   prefix=topic,
                                   callback=self._handle_publish)
 
+        for site in (self.fleet.site_names if self.fleet else ["AGH/D17"]):
+            self.vip.pubsub.subscribe(peer='pubsub',
+                                      prefix="devices/{}/Panel/resync".format(site),
+                                      callback=self.on_resync)
+
+    def on_resync(self, peer, sender, bus, topic, headers,
+                                message):
+        # HubAgent missed an update, the next one carries the whole profile
+        self.sent.pop((topic.rsplit('/', 1)[0] + "/profile", message[0]['device']), None)
+
     def _handle_publish(self, peer, sender, bus, topic, headers,
                                 message):
         pass
 
+    def encode_profile(self, topic, profile):
+        if topic not in self.profile_encodings:
+            return list(profile)
+        return encode_profile(profile, **self.profile_encodings[topic])
+
+    def profile_update(self, topic, profile, device='SolarAgent'):
+        """Returns fields of a source message carrying the profile, either whole or as a delta
+        against the profile sent before, shifted by the ticks elapsed since."""
+        if not self.delta_updates:
+            return {'profile': self.encode_profile(topic, profile)}
+
+        key = (topic, device)
+        seq = self.seq[key] = self.seq.get(key, 0) + 1
+        update = {'seq': seq, 'tick': self.tick}
+        previous = None
+        if key in self.sent:
+            sent, sent_tick = self.sent[key]
+            previous = sent[self.tick - sent_tick:]
+        if previous is None or len(profile) < len(previous) or seq % self.base_interval == 0:
+            update['profile'] = self.encode_profile(topic, profile)
+            sent = np.array(profile, dtype=float)
+        else:
+            indices, values, tail, sent = profile_delta(previous, profile, self.delta_tolerance)
+            update.update(indices=indices.tolist(), values=values.tolist(),
+                          tail=self.encode_profile(topic, tail))
+        self.sent[key] = (sent, self.tick)
+        return update
+
+
+    def day_start(self) -> float:
+        """Timestamp of the local midnight the simulated day starts at, as in pv_profile."""
+        offset = self.utc_offset * 60*60
+        return (time.time() + offset) // (24*60*60) * (24*60*60) - offset
 
     def simulate_solar_profile(self, time: int, a: float = 0.0):  # a -> pora roku
-        czas = np.arange(0, 24, 15/60)
-        noise = np.random.uniform(low=-0.2, high=0, size=len(czas))
-        power = np.sin((2*np.pi/24)*(czas-6)) + a + noise
-        power = np.clip(power, 0, 1)
-        power *= self.weather_factor
-        return np.concatenate((power[time:], power[:time]))
+        # a view into the simulator's buffer, overwritten by the next call
+        curve = None
+        if self.pv_panel:
+            curve = pv_profile(self.pv_panel, (self.latitude, self.longitude), date.today(), utc_offset=self.utc_offset)
+        return self.simulator.profile(time, a, self.weather_factor, curve)
 
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
@@ -147,37 +294,56 @@ class Solaragent(Agent):
 
         #Exmaple RPC call
         #self.vip.rpc.call("some_agent", "some_method", arg1, arg2)
-        while True:
-            for i in range(24*4):
-                if i%4 == 0:
-                    self.set_weather_factor()
-
-                profile = self.simulate_solar_profile(i)
-                request = {
-                    'device': 'SolarAgent',
-                    'profile': list(profile),
-                    'timeout': 0,
-                    'id': 0
-                }
-                self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Panel/all", message=
-                    [{'moc': profile[0],
-                    'czas': i/4 },{'moc':{'type':'float','tz':'US/Pacific','units':'Watt'},
-                                                'czas':{'type':'float','tz':'US/Pacific','units':'Hours'}}])
-
-                self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Panel/profile", message=[request])
-                time.sleep(1)
-
-
-
-
-        while True:
-            for hour in range(24):
-                for minutes in range(0,60,15):
-                    self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Panel/all", message=
-                        [{'moc': self.clipped_power(hour+minutes/60, 0),
-                        'czas': hour+minutes/60 },{'moc':{'type':'float','tz':'US/Pacific','units':'Watt'},
-                                                    'czas':{'type':'float','tz':'US/Pacific','units':'Hours'}}])
-                    time.sleep(0.1)
+        self.publisher = self.core.periodic(self.publish_period, self.publish_profile)
+
+    def publish_profile(self):
+        i = self.tick % (24*4)
+        if self.fleet:
+            self.publish_fleet(i)
+            self.tick += 1
+            return
+
+        if self.weather_source == "forecast":
+            profile = self.simulate_solar_profile(i)
+            forecast = self.weather.get()
+            if forecast is not None:
+                profile *= cloud_factors(*forecast, self.day_start() + i*15*60, len(profile))
+        else:
+            self.weather_factor = self.weather.get()
+            profile = self.simulate_solar_profile(i)
+        request = {
+            'device': 'SolarAgent',
+            **self.profile_update("devices/AGH/D17/Panel/profile", profile),
+            'timeout': 0,
+            'id': 0
+        }
+        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Panel/all", message=
+            [{'moc': profile[0],
+            'czas': i/4 },{'moc':{'type':'float','tz':'US/Pacific','units':'Watt'},
+                                        'czas':{'type':'float','tz':'US/Pacific','units':'Hours'}}])
+
+        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Panel/profile", message=[request])
+        self.tick += 1
+
+    def publish_fleet(self, i):
+        forecasts = [weather.get() for weather in self.fleet_weather]
+        profiles = self.fleet.profiles(self.simulator, i, date.today(), forecasts, self.day_start() + i*15*60)
+
+        if self.publish_mode == "hub":
+            sources = [(site, 'SolarAgent', profile)
+                       for site, profile in zip(self.fleet.site_names, self.fleet.site_profiles(profiles))]
+        else:
+            sources = zip(self.fleet.sites, self.fleet.names, profiles)
+
+        for site, device, profile in sources:
+            topic = "devices/{}/Panel/profile".format(site)
+            request = {
+                'device': device,
+                **self.profile_update(topic, profile, device),
+                'timeout': 0,
+                'id': 0
+            }
+            self.vip.pubsub.publish('pubsub', topic, message=[request])
 
     @Core.receiver("onstop")
     def onstop(self, sender, **kwargs):
@@ -185,7 +351,12 @@ class Solaragent(Agent):
         This method is called when the Agent is about to shutdown, but before it disconnects from
         the message bus.
         """
-        pass
+        if self.publisher:
+            self.publisher.kill()
+        self.weather.close()
+        if self.fleet:
+            for weather in self.fleet_weather:
+                weather.close()
 
     @RPC.export
     def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
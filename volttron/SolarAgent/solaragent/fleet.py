@@ -0,0 +1,77 @@
+from datetime import date
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .forecast import cloud_factors
+from .pvmodel import Panel, pv_profile
+from .simulation import SolarSimulator
+
+
+def location_key(config: dict, registry=None) -> Tuple[Hashable, Tuple[float, float]]:
+    """Returns weather location of a panel and its coordinates. Panels with a `city` (and `country`)
+    share the city's id from the CityIDRegistry, others share coordinates rounded to about a kilometer."""
+    if 'city' in config:
+        location = registry.locations_for(config['city'], country=config.get('country'))[0]
+        return ('city', location.get_ID()), (location.get_lat(), location.get_lon())
+    lat, lon = float(config['latitude']), float(config['longitude'])
+    return ('coords', round(lat, 2), round(lon, 2)), (lat, lon)
+
+
+class SolarFleet:
+    """Many panels of many sites simulated as one 2-D array, one row per panel.
+
+    Weather is looked up once per distinct location and profiles can be summed per site
+    with one matrix product.
+    """
+
+    def __init__(self, panels: List[dict], registry=None, utc_offset: float = 0.0, ticks: int = 24*4):
+        self.ticks: int = ticks
+        self.utc_offset: float = utc_offset
+        self.names: List[str] = [config['name'] for config in panels]
+        self.sites: List[str] = [config.get('site', "AGH/D17") for config in panels]
+        self.panels: List[Panel] = [
+            Panel(**{field: config[field] for field in ('tilt', 'azimuth', 'kwp', 'efficiency') if field in config})
+            for config in panels
+        ]
+
+        self.locations: List[Hashable] = []  # distinct weather locations
+        self.coordinates: List[Tuple[float, float]] = []  # of every panel
+        location_index = []
+        for config in panels:
+            key, coordinates = location_key(config, registry)
+            if key not in self.locations:
+                self.locations.append(key)
+            location_index.append(self.locations.index(key))
+            self.coordinates.append(coordinates)
+        self.location_index = np.array(location_index, dtype=int)
+
+        self.site_names: List[str] = sorted(set(self.sites))
+        self.membership = np.zeros((len(self.site_names), len(panels)))  # site x panel
+        self.membership[[self.site_names.index(site) for site in self.sites], np.arange(len(panels))] = 1
+
+        self._curves: Dict[date, np.array] = {}
+
+    def curves(self, day: date) -> np.array:
+        """Returns clear-sky energy of every panel in every tick of a day, in kWh per tick as pv_profile."""
+        if day not in self._curves:
+            self._curves = {day: np.stack([
+                pv_profile(panel, coordinates, day, self.ticks, self.utc_offset)
+                for panel, coordinates in zip(self.panels, self.coordinates)
+            ])}
+        return self._curves[day]
+
+    def profiles(self, simulator: SolarSimulator, time: int, day: date,
+                 forecasts: List[Optional[Tuple[np.array, np.array]]], start: float) -> np.array:
+        """Returns profiles of all panels from tick `time` on (kWh per tick), `start` being its unix time.
+        `forecasts` are given per location, None when unknown yet."""
+        factors = np.ones((len(self.locations), self.ticks))
+        for k, forecast in enumerate(forecasts):
+            if forecast is not None:
+                factors[k] = cloud_factors(*forecast, start, self.ticks)
+        profiles = simulator.profiles(time, self.curves(day))
+        profiles *= factors[self.location_index]
+        return profiles
+
+    def site_profiles(self, profiles: np.array) -> np.array:
+        return self.membership @ profiles
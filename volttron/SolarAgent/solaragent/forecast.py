@@ -0,0 +1,32 @@
+from typing import Tuple
+
+import numpy as np
+
+# clear-sky irradiance under cloud cover N (0..1) is scaled by 1 - 0.75 N^3.4 (Kasten and Czeplak)
+CLOUD_ATTENUATION = 0.75
+CLOUD_EXPONENT = 3.4
+
+
+def fetch_forecast(owm, lat: float, lon: float) -> Tuple[np.array, np.array]:
+    """Returns times (unix) and cloud cover (percent) of the three-hour forecast slots at a place."""
+    return forecast_clouds(owm.three_hours_forecast_at_coords(lat, lon))
+
+
+def fetch_forecast_at_id(owm, city_id: int) -> Tuple[np.array, np.array]:
+    """Same as fetch_forecast for a city of the CityIDRegistry."""
+    return forecast_clouds(owm.three_hours_forecast_at_id(city_id))
+
+
+def forecast_clouds(forecaster) -> Tuple[np.array, np.array]:
+    weathers = forecaster.get_forecast().get_weathers()
+    times = np.array([weather.get_reference_time() for weather in weathers], dtype=float)
+    clouds = np.array([weather.get_clouds() for weather in weathers], dtype=float)
+    return times, clouds
+
+
+def cloud_factors(times: np.array, clouds: np.array, start: float, ticks: int, tick: float = 15*60) -> np.array:
+    """Returns share of clear-sky power in each of `ticks` ticks from `start` (unix), interpolating
+    the cloud cover between forecast slots. Before and after the forecast the nearest slot holds."""
+    grid = start + tick * np.arange(ticks)
+    cover = np.interp(grid, times, clouds) / 100
+    return 1 - CLOUD_ATTENUATION * cover ** CLOUD_EXPONENT
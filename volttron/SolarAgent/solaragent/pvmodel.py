@@ -0,0 +1,78 @@
+"""
+Clear-sky production of photovoltaic panels.
+
+Sun position follows the NOAA general solar position equations, computed for
+all ticks of a day at once. Beam irradiance follows Meinel's air mass model,
+diffuse irradiance is taken as a tenth of it, and the panel receives both
+according to its tilt and azimuth.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+SOLAR_CONSTANT = 1353.0  # W/m2
+STC_IRRADIANCE = 1000.0  # W/m2 at which panel's kWp is rated
+
+
+@dataclass(frozen=True)
+class Panel:
+    tilt: float = 30.0  # degrees from horizontal
+    azimuth: float = 180.0  # degrees clockwise from north, 180 faces south
+    kwp: float = 1.0
+    efficiency: float = 0.86  # losses of inverter, wiring and heat
+
+
+@lru_cache(maxsize=64)
+def sun_position(lat: float, lon: float, day: date, ticks: int = 24*4, utc_offset: float = 0.0) -> Tuple[np.array, np.array]:
+    """Returns solar elevation and azimuth (degrees, clockwise from north) in the middle of every
+    tick of a day. Ticks start at local midnight, `utc_offset` hours ahead of UTC."""
+    hours = (np.arange(ticks) + 0.5) * 24 / ticks - utc_offset  # UTC
+    gamma = 2 * np.pi / 365 * (day.timetuple().tm_yday - 1 + (hours - 12) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    true_solar_minutes = hours * 60 + eqtime + 4 * lon
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    phi = np.radians(lat)
+
+    cos_zenith = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    elevation = 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+    azimuth = np.degrees(np.arctan2(np.sin(hour_angle),
+                                    np.cos(hour_angle) * np.sin(phi) - np.tan(decl) * np.cos(phi))) + 180
+
+    elevation.flags.writeable = False  # shared by all panels of a site
+    azimuth.flags.writeable = False
+    return elevation, azimuth
+
+
+def panel_power(panel: Panel, elevation: np.array, azimuth: np.array) -> np.array:
+    """Returns clear-sky power of a panel (kW) for given sun positions."""
+    up = elevation > 0
+    cos_zenith = np.sin(np.radians(elevation))
+    air_mass = 1 / np.where(up, cos_zenith, 1)
+    beam = np.where(up, SOLAR_CONSTANT * 0.7 ** (air_mass ** 0.678), 0)
+    diffuse = 0.1 * beam
+
+    tilt = np.radians(panel.tilt)
+    cos_incidence = (cos_zenith * np.cos(tilt)
+                     + np.cos(np.radians(elevation)) * np.sin(tilt) * np.cos(np.radians(azimuth - panel.azimuth)))
+    irradiance = beam * np.clip(cos_incidence, 0, None) + diffuse * (1 + np.cos(tilt)) / 2
+    return panel.kwp * panel.efficiency * irradiance / STC_IRRADIANCE
+
+
+@lru_cache(maxsize=256)
+def pv_profile(panel: Panel, site: Tuple[float, float], day: date, ticks: int = 24*4,
+               utc_offset: float = 0.0) -> np.array:
+    """Returns clear-sky energy a panel produces in every tick of a day (kWh per tick), see sun_position.
+    Like request profiles, source profiles carry energy per tick rather than power."""
+    lat, lon = site
+    energy = panel_power(panel, *sun_position(lat, lon, day, ticks, utc_offset)) * (24 / ticks)
+    energy.flags.writeable = False
+    return energy
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class SolarSimulator:
+    """Produces noisy solar profiles of a day starting at a given tick, without allocating.
+
+    The clear-sky curve is computed only when its parameter changes and noise is drawn
+    for `block` profiles at once. A profile is written twice in a row into one buffer, so
+    its rotation by any number of ticks is a view. The view is valid until the next call.
+    """
+
+    def __init__(self, ticks: int = 24*4, block: int = 1024, seed: int = None):
+        self.ticks: int = ticks
+        self.rng = np.random.default_rng(seed)
+        self.czas = np.arange(0, 24, 24/ticks)
+        self._a: float = None
+        self._curve = np.empty(ticks)
+        self._noise = np.empty((block, ticks))
+        self._next: int = block  # next unused row of noise
+        self._buffer = np.empty(2*ticks)
+        self._rows: np.array = None  # buffers of many panels, see profiles
+        self._row_noise: np.array = None
+
+    def curve(self, a: float = 0.0) -> np.array:
+        """Returns clear-sky curve, `a` shifts it up or down with the season."""
+        if a != self._a:
+            np.sin((2*np.pi/24)*(self.czas-6), out=self._curve)
+            self._curve += a
+            self._a = a
+        return self._curve
+
+    def profile(self, time: int, a: float = 0.0, factor: float = 1.0, curve: np.array = None) -> np.array:
+        """Returns profile of a day from tick `time` on. A given clear-sky `curve`, e.g. of pvmodel,
+        replaces the sine one and is dimmed by the noise rather than shifted."""
+        if self._next == len(self._noise):
+            self._noise[:] = self.rng.uniform(low=-0.2, high=0, size=self._noise.shape)
+            self._next = 0
+        noise = self._noise[self._next]
+        self._next += 1
+
+        day = self._buffer[:self.ticks]
+        if curve is None:
+            np.add(self.curve(a), noise, out=day)
+            np.clip(day, 0, 1, out=day)
+        else:
+            np.add(noise, 1, out=day)
+            day *= curve
+        day *= factor
+        self._buffer[self.ticks:] = day
+        return self._buffer[time:time+self.ticks]
+
+    def profiles(self, time: int, curves: np.array) -> np.array:
+        """Returns profiles of many panels from tick `time` on, one row per clear-sky curve, each
+        dimmed by its own noise. The view is valid until the next call."""
+        if self._rows is None or self._rows.shape[0] != len(curves):
+            self._rows = np.empty((len(curves), 2*self.ticks))
+            self._row_noise = np.empty((len(curves), self.ticks))
+        noise = self._row_noise
+        self.rng.random(out=noise)
+        noise *= 0.2
+        noise += 0.8
+
+        days = self._rows[:, :self.ticks]
+        np.multiply(curves, noise, out=days)
+        self._rows[:, self.ticks:] = days
+        return self._rows[:, time:time+self.ticks]
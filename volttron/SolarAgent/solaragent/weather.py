@@ -0,0 +1,44 @@
+import logging
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+_log = logging.getLogger(__name__)
+
+
+class WeatherFetcher:
+    """Keeps the latest result of `fetch`, e.g. a call to the weather API.
+
+    `get` never waits for the network. It returns the cached value and, once the value is older
+    than `ttl` seconds, starts a refresh in the background which later calls pick up. A failed
+    refresh keeps the previous value and is retried after another `ttl`.
+    """
+
+    def __init__(self, fetch: Callable[[], Any], ttl: float, default: Any, executor: Executor = None):
+        self.fetch: Callable[[], Any] = fetch
+        self.ttl: float = ttl
+        self.value: Any = default
+        self.executor: Executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.fetched_at: float = None
+        self.failures: int = 0
+        self._future: Future = None
+
+    def get(self) -> Any:
+        self._collect()
+        if self._future is None and (self.fetched_at is None or time.time() - self.fetched_at >= self.ttl):
+            self._future = self.executor.submit(self.fetch)
+        return self.value
+
+    def _collect(self) -> None:
+        if self._future is None or not self._future.done():
+            return
+        future, self._future = self._future, None
+        self.fetched_at = time.time()
+        if future.exception() is not None:
+            self.failures += 1
+            _log.warning("Weather refresh failed: {}".format(future.exception()))
+            return
+        self.value = future.result()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
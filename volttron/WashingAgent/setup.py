@@ -18,6 +18,7 @@ setup(
     description="Washing machine",
     install_requires=['volttron'],
     packages=packages,
+    package_data={agent_package: ['profiles.json']},
     entry_points={
         'setuptools.installation': [
             'eggsecutable = ' + agent_module + ':main',
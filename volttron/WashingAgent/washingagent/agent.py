@@ -1,5 +1,6 @@
 """
-Agent documentation goes here.
+Appliance agent: drives many virtual devices (washing machines, dishwashers,
+EV chargers, heat pumps) whose requests follow configurable arrival processes.
 """
 
 __docformat__ = 'reStructuredText'
@@ -8,12 +9,18 @@ import logging
 import sys
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent, Core, RPC
-import random
+import os
+
+from .appliances import ApplianceFleet, ProfileLibrary
 
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
 
+# a single washing machine used once, as before
+DEFAULT_DEVICES = [{"name": "WashingMachine1", "appliance": "washing_machine", "program": "default",
+                    "arrival": {"process": "once"}, "timeout": 15}]
+
 
 def washingagent(config_path, **kwargs):
     """Parses the Agent configuration and returns an instance of
@@ -35,9 +42,19 @@ def washingagent(config_path, **kwargs):
 
     setting1 = int(config.get('setting1', 1))
     setting2 = config.get('setting2', "some/random/topic")
+    site = config.get('site', "AGH/D17")
+    tick_period = float(config.get('tick_period', 1.0))
+    profile_library = config.get('profile_library', "")
+    devices = config.get('devices', DEFAULT_DEVICES)
+    seed = config.get('seed')
 
     return Washingagent(setting1,
                           setting2,
+                          site,
+                          tick_period,
+                          profile_library,
+                          devices,
+                          seed,
                           **kwargs)
 
 
@@ -47,12 +64,19 @@ class Washingagent(Agent):
     """
 
     def __init__(self, setting1=1, setting2="some/random/topic",
+                 site="AGH/D17", tick_period=1.0, profile_library="", devices=None, seed=None,
                  **kwargs):
         super(Washingagent, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
         self.setting1 = setting1
         self.setting2 = setting2
+        self.site = site
+        # every tick_period seconds the virtual devices advance by one 15-minute tick
+        self.tick_period = tick_period
+        self.publisher = None
+        library = ProfileLibrary.load(profile_library or os.path.join(os.path.dirname(__file__), "profiles.json"))
+        self.fleet = ApplianceFleet.from_config(devices or DEFAULT_DEVICES, library, seed)
 
         self.default_config = {"setting1": setting1,
                                "setting2": setting2}
@@ -115,14 +139,13 @@ class Washingagent(Agent):
 
         #Exmaple RPC call
         #self.vip.rpc.call("some_agent", "some_method", arg1, arg2)
-        request = {
-            'device': 'WashingMachine1',
-            'profile': [0.1, 0.2, 0.3, 0.3, 0.2, 0.2, 0.4],
-            'timeout': 15,
-            'id': random.getrandbits(128)
-        }
+        self.publisher = self.core.periodic(self.tick_period, self.publish_requests)
 
-        self.vip.pubsub.publish('pubsub', "devices/AGH/D17/Device/request", message=[request])
+    def publish_requests(self):
+        requests = self.fleet.step()
+        if requests:
+            # requests of all devices used in a tick go in one message
+            self.vip.pubsub.publish('pubsub', "devices/{}/Device/request".format(self.site), message=[requests])
 
     @Core.receiver("onstop")
     def onstop(self, sender, **kwargs):
@@ -130,7 +153,8 @@ class Washingagent(Agent):
         This method is called when the Agent is about to shutdown, but before it disconnects from
         the message bus.
         """
-        pass
+        if self.publisher:
+            self.publisher.kill()
 
     @RPC.export
     def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
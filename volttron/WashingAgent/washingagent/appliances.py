@@ -0,0 +1,147 @@
+import heapq
+import json
+import random
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+TICKS_PER_HOUR = 4
+
+
+class ProfileLibrary:
+    """Energy profiles of appliance programs, loaded from a JSON file of
+    {appliance: {program: [kWh per tick, ...]}}."""
+
+    def __init__(self, profiles: Dict[str, Dict[str, np.array]]):
+        self.profiles: Dict[str, Dict[str, np.array]] = profiles
+
+    @classmethod
+    def load(cls, path: str) -> 'ProfileLibrary':
+        with open(path) as f:
+            data = json.load(f)
+        return cls({
+            appliance: {program: np.array(profile, dtype=float) for program, profile in programs.items()}
+            for appliance, programs in data.items() if not appliance.startswith('_')
+        })
+
+    def profile(self, appliance: str, program: str = None, rng: np.random.Generator = None) -> Tuple[str, np.array]:
+        """Returns the given program of an appliance, or a random one."""
+        programs = self.profiles[appliance]
+        if program is None:
+            program = list(programs)[rng.integers(len(programs))]
+        return program, programs[program]
+
+
+class ArrivalProcess(ABC):
+    """Tells when a device is used next, in ticks."""
+
+    @abstractmethod
+    def next_arrival(self, tick: float, rng: np.random.Generator) -> Optional[float]:
+        pass
+
+
+class PoissonArrivals(ArrivalProcess):
+    def __init__(self, rate: float):
+        self.rate: float = rate  # uses per hour
+
+    def next_arrival(self, tick, rng):
+        return tick + rng.exponential(TICKS_PER_HOUR / self.rate)
+
+
+class DailyArrivals(ArrivalProcess):
+    """Uses at given hours of every day, each one shifted by normally distributed `jitter` hours."""
+
+    def __init__(self, hours: List[float], jitter: float = 0.0):
+        self.hours: np.array = np.sort(np.array(hours, dtype=float))
+        self.jitter: float = jitter
+
+    def next_arrival(self, tick, rng):
+        day, hour = divmod(tick / TICKS_PER_HOUR, 24)
+        later = self.hours[self.hours > hour]
+        hour = later[0] if len(later) else self.hours[0] + 24
+        return max((day * 24 + hour + rng.normal(0, self.jitter)) * TICKS_PER_HOUR, tick)
+
+
+class OnceArrivals(ArrivalProcess):
+    def __init__(self, at: float = 0.0):
+        self.at: float = at  # hours
+
+    def next_arrival(self, tick, rng):
+        at = self.at * TICKS_PER_HOUR
+        return at if tick <= at else None
+
+
+ARRIVAL_PROCESSES = {
+    'poisson': PoissonArrivals,
+    'daily': DailyArrivals,
+    'once': OnceArrivals,
+}
+
+
+def arrival_process(config: dict) -> ArrivalProcess:
+    config = dict(config)
+    return ARRIVAL_PROCESSES[config.pop('process')](**config)
+
+
+@dataclass
+class VirtualDevice:
+    name: str
+    appliance: str
+    arrivals: ArrivalProcess
+    timeout: int  # ticks a request may be postponed
+    program: str = None  # random program of the appliance if not given
+
+
+class ApplianceFleet:
+    """Generates requests of many virtual devices.
+
+    Next uses of all devices are kept in a heap, so a tick costs only the devices used in it.
+    A device is not used again before its previous request could have finished.
+    """
+
+    def __init__(self, devices: List[VirtualDevice], library: ProfileLibrary, seed: int = None):
+        self.devices: Dict[str, VirtualDevice] = {device.name: device for device in devices}
+        self.library: ProfileLibrary = library
+        self.rng = np.random.default_rng(seed)
+        self.ids = random.Random(seed)
+        self.tick: int = 0
+        self._next: List[Tuple[float, str]] = []
+        for device in devices:
+            self._push(device, 0)
+
+    @classmethod
+    def from_config(cls, devices: List[dict], library: ProfileLibrary, seed: int = None) -> 'ApplianceFleet':
+        """Creates devices of a config, an entry with a `count` stands for that many numbered devices."""
+        created = []
+        for config in devices:
+            names = [config['name']] if 'count' not in config else [
+                "{}{}".format(config['name'], k) for k in range(1, config['count'] + 1)]
+            for name in names:
+                created.append(VirtualDevice(name, config['appliance'], arrival_process(config['arrival']),
+                                             int(config.get('timeout', 0)), config.get('program')))
+        return cls(created, library, seed)
+
+    def _push(self, device: VirtualDevice, tick: float) -> None:
+        arrival = device.arrivals.next_arrival(tick, self.rng)
+        if arrival is not None:
+            heapq.heappush(self._next, (arrival, device.name))
+
+    def step(self) -> List[dict]:
+        """Advances by one tick and returns requests of devices used in it."""
+        requests = []
+        while self._next and self._next[0][0] < self.tick + 1:
+            _, name = heapq.heappop(self._next)
+            device = self.devices[name]
+            program, profile = self.library.profile(device.appliance, device.program, self.rng)
+            requests.append({
+                'device': name,
+                'program': program,
+                'profile': profile.tolist(),
+                'timeout': device.timeout,
+                'id': self.ids.getrandbits(128)
+            })
+            self._push(device, self.tick + len(profile) + device.timeout)
+        self.tick += 1
+        return requests